@@ -0,0 +1,45 @@
+from importlib import import_module
+from typing import Sequence, Optional
+
+from bootstrapping.backends.base import CountingBackend
+from bootstrapping.contexts import ContextType
+
+# Modules and classes of the backends, the modules are imported only when the backend is selected, so that the
+# optional dependencies (NumPy, Numba) are needed only by the backends using them.
+BACKENDS = {
+    "python": ("bootstrapping.backends.python_backend", "PythonBackend"),
+    "numpy": ("bootstrapping.backends.numpy_backend", "NumpyBackend"),
+    "numba": ("bootstrapping.backends.numba_backend", "NumbaBackend"),
+}
+
+
+def is_backend_available(name: str) -> bool:
+    """
+    Check whether the dependencies of the counting backend of the given name are installed.
+    """
+    try:
+        import_module(BACKENDS[name][0])
+    except ImportError:
+        return False
+    return True
+
+
+def get_backend(name: str, corpus: Sequence[str], context_types: Sequence[ContextType], start: int = 0,
+                stop: Optional[int] = None) -> CountingBackend:
+    """
+    Create the counting backend of the given name over the given corpus.
+    :param name: Name of the backend, one of `BACKENDS`.
+    :param corpus: The unannotated corpus.
+    :param context_types: Types of the contexts to consider.
+    :param start: Position of the first word to count.
+    :param stop: Position after the last word to count, the end of the corpus by default.
+    :return: The backend.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown counting backend '{name}', choose one of: {', '.join(BACKENDS)}")
+    module_name, class_name = BACKENDS[name]
+    try:
+        module = import_module(module_name)
+    except ImportError as e:
+        raise RuntimeError(f"The counting backend '{name}' is not available: {e}") from e
+    return getattr(module, class_name)(corpus, context_types, start=start, stop=stop)
@@ -0,0 +1,147 @@
+from abc import ABC, abstractmethod
+from typing import Iterator, Sequence, Optional, MutableMapping
+
+from bootstrapping.contexts import ContextType, Context
+from evidence_modeling.frequency import Frequency
+
+
+class CountingBackend(ABC):
+    """
+    Counting kernels of the context bootstrapping over a fixed corpus: extraction of the contexts, the initial counts
+    of the contexts, and the updates of the context and noun frequencies by the frontier of newly decided nouns and
+    contexts. All the backends must give identical results (see `bootstrapping.backends.parity`).
+
+    Only the words at the positions from `start` to `stop` of the corpus are counted, the words around them serve only
+    as their contexts. This way, a shard of a corpus can be given together with its neighbouring words.
+
+    The corpus may be extended by appending tokens to it, which the backend then counts by `extend`.
+    """
+    name: str
+    corpus: Sequence[str]
+    context_types: Sequence[ContextType]
+    start: int
+    stop: int
+
+    def __init__(self, corpus: Sequence[str], context_types: Sequence[ContextType], start: int = 0,
+                 stop: Optional[int] = None) -> None:
+        self.corpus = corpus
+        self.context_types = context_types
+        self.start = start
+        self.stop = len(corpus) if stop is None else stop
+
+    @abstractmethod
+    def iterate_over_words_and_contexts(self) -> Iterator[tuple[str, Context]]:
+        """
+        Iterate over all pairs (word, context of the word) of the counted words, ordered by the position of the word
+        and then by the order of the context types.
+        """
+
+    @abstractmethod
+    def get_initial_gender_frequencies_of_contexts(
+            self,
+            frequencies: Optional[MutableMapping[Context, Frequency]] = None) -> MutableMapping[Context, Frequency]:
+        """
+        Extract all contexts of the counted words and initialize their counts.
+        :param frequencies: Empty table to store the counts in (e.g. a `SpillingFrequencyTable`, so that the counts
+        need not fit into the memory), a new dictionary by default.
+        :return: The table of frequencies.
+        """
+
+    @abstractmethod
+    def update_frequencies_and_get_updated_contexts(self, context_frequencies: MutableMapping[Context, Frequency],
+                                                    all_new_nouns: set[str], new_masc_nouns: set[str]) -> set[Context]:
+        """
+        On every occurrence of a newly added noun, update the counts of the corresponding contexts. Modifies the given
+        context frequencies dictionary.
+        :param context_frequencies: Frequencies of the contexts of the corpus.
+        :param all_new_nouns: All new nouns (fem and masc).
+        :param new_masc_nouns: New masc nouns.
+        :return: The set of updated contexts.
+        """
+
+    @abstractmethod
+    def update_noun_frequencies_and_get_updated_words(self, all_new_contexts: set[Context], all_nouns: set[str],
+                                                      noun_frequencies: MutableMapping[str, Frequency],
+                                                      new_masc_contexts: set[Context]) -> set[str]:
+        """
+        Update the noun frequencies, based on new contexts. Modifies the given noun frequencies dictionary.
+        :param all_new_contexts: All new contexts (fem and masc).
+        :param all_nouns: Set of all tokens considered to be nouns.
+        :param noun_frequencies: Frequencies of the nouns.
+        :param new_masc_contexts: New masc contexts.
+        :return: The set of updated words.
+        """
+
+    def extend(self, context_frequencies: MutableMapping[Context, Frequency],
+               noun_frequencies: MutableMapping[str, Frequency], all_nouns: set[str], masc_nouns: set[str],
+               fem_nouns: set[str], masc_contexts: set[Context], fem_contexts: set[Context]) -> \
+            tuple[set[Context], set[str]]:
+        """
+        Count also the words appended to the corpus, up to its new end, the backend counting up to the end of the
+        corpus before it was extended. The counts of the new (word, context) pairs are added to the given context
+        frequencies, as masculine or feminine for the decided nouns, and the evidence of the decided contexts is added
+        to the given noun frequencies. Modifies the given frequencies. Takes time proportional to the number of the
+        appended words.
+        :param context_frequencies: Frequencies of the contexts of the corpus before it was extended.
+        :param noun_frequencies: Frequencies of the nouns, including the plain counts of the appended nouns.
+        :param all_nouns: Set of all tokens considered to be nouns.
+        :param masc_nouns: Nouns decided to be masculine.
+        :param fem_nouns: Nouns decided to be feminine.
+        :param masc_contexts: Contexts decided to be masculine.
+        :param fem_contexts: Contexts decided to be feminine.
+        :return: The contexts and the nouns whose counts have changed.
+        """
+        start = self.stop
+        self.stop = len(self.corpus)
+
+        updated_contexts = set()
+        updated_words = set()
+        for word, context in iterate_over_appended_words_and_contexts(corpus=self.corpus, start=start,
+                                                                      context_types=self.context_types):
+            context_frequency = context_frequencies.setdefault(context, Frequency(quest=0, masc=0, fem=0))
+            if word in masc_nouns:
+                context_frequency.masc += 1
+            elif word in fem_nouns:
+                context_frequency.fem += 1
+            else:
+                context_frequency.quest += 1
+            updated_contexts.add(context)
+
+            if word in all_nouns and (context in masc_contexts or context in fem_contexts):
+                noun_frequency = noun_frequencies[word]
+                noun_frequency.quest -= 1
+                if context in masc_contexts:
+                    noun_frequency.masc += 1
+                else:
+                    noun_frequency.fem += 1
+                updated_words.add(word)
+
+        return updated_contexts, updated_words
+
+
+def iterate_over_appended_words_and_contexts(
+        corpus: Sequence[str],
+        start: int,
+        context_types: Sequence[ContextType]) -> Iterator[tuple[str, Context]]:
+    """
+    For given corpus extended after its first `start` tokens, iterate over the pairs (word, context of the word) that
+    are in the extended corpus, but not in `corpus[:start]`. Besides the pairs of the appended words, these are the
+    right and bilateral contexts of the last word before the extension. Takes time proportional to the number of the
+    appended words.
+    """
+    # Two words before the extension suffice to get all the contexts of the last word before the extension
+    window_start = max(start - 2, 0)
+    window = corpus[window_start:]
+    offset = start - window_start
+    original_window = window[:offset]
+
+    for i in range(max(offset - 1, 0), len(window)):
+        for context_type in context_types:
+            context = Context.get_from_corpus_index(context_type=context_type, corpus=window, index=i)
+            if context is None:
+                continue
+            if i < offset and Context.get_from_corpus_index(context_type=context_type, corpus=original_window,
+                                                            index=i) is not None:
+                # the context has already been in the original corpus
+                continue
+            yield window[i], context
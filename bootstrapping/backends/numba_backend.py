@@ -0,0 +1,42 @@
+import numpy as np
+from numba import njit
+
+from bootstrapping.backends.numpy_backend import NumpyBackend
+
+
+@njit(cache=True)
+def count_by_flags(keys: np.ndarray, values: np.ndarray, is_selected_key: np.ndarray, is_masc_key: np.ndarray,
+                   is_allowed_value: np.ndarray, size: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    For every value, count its pairs with the selected masculine and with the selected feminine keys, considering only
+    the allowed values.
+    """
+    masc = np.zeros(size, dtype=np.int64)
+    fem = np.zeros(size, dtype=np.int64)
+    for i in range(len(keys)):
+        key = keys[i]
+        value = values[i]
+        if is_selected_key[key] and is_allowed_value[value]:
+            if is_masc_key[key]:
+                masc[value] += 1
+            else:
+                fem[value] += 1
+    return masc, fem
+
+
+class NumbaBackend(NumpyBackend):
+    """
+    Backend with the same encoding of the corpus as the NumPy backend, but with the masked counts compiled by Numba
+    into single passes over the pairs, without the temporary arrays of the vectorized version.
+    """
+    name = "numba"
+
+    def _count_contexts_of_words(self, is_new_word: np.ndarray,
+                                 is_masc_word: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return count_by_flags(self.pair_words, self.pair_contexts, is_new_word, is_masc_word,
+                              np.ones(self.context_count, dtype=np.bool_), self.context_count)
+
+    def _count_words_of_contexts(self, is_new_context: np.ndarray, is_masc_context: np.ndarray,
+                                 is_noun: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return count_by_flags(self.pair_contexts, self.pair_words, is_new_context, is_masc_context, is_noun,
+                              len(self.vocabulary))
@@ -0,0 +1,397 @@
+import bisect
+from typing import Iterator, Sequence, Optional, MutableMapping
+
+import numpy as np
+
+from bootstrapping.backends.base import CountingBackend
+from bootstrapping.contexts import ContextType, Context, SUFFIX_LENGTH
+from evidence_modeling.frequency import Frequency
+from raw_corpus.token_corpus import TokenCorpus
+from storage.frequency_table import prefetch
+
+# For each context type: whether it uses the left word, whether it uses the right word and whether it uses only the
+# suffixes of the words.
+CONTEXT_TYPE_SHAPES = {
+    ContextType.LEFT_WHOLE_WORD: (True, False, False),
+    ContextType.RIGHT_WHOLE_WORD: (False, True, False),
+    ContextType.BILATERAL_WHOLE_WORD: (True, True, False),
+    ContextType.LEFT_SUFFIX: (True, False, True),
+    ContextType.RIGHT_SUFFIX: (False, True, True),
+    ContextType.BILATERAL_SUFFIX: (True, True, True),
+}
+
+
+# Multiplier of the id of the left part of a bilateral context in its integer key, larger than any token id, so that
+# the keys do not change when the vocabulary grows.
+KEY_BASE = 2 ** 32
+
+
+class GrowingArray:
+    """
+    Array to which values can be appended in amortized time proportional to their number, growing its capacity by a
+    quarter when full.
+    """
+
+    def __init__(self, values: np.ndarray) -> None:
+        self._buffer = values
+        self.size = len(values)
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._buffer[:self.size]
+
+    def extend(self, values: np.ndarray) -> None:
+        size = self.size + len(values)
+        if self.size == 0 and size > len(self._buffer):
+            # The values are taken over instead of being copied, e.g. the whole initial encoding
+            self._buffer = values
+            self.size = size
+            return
+        if size > len(self._buffer):
+            buffer = np.empty(max(size, len(self._buffer) + len(self._buffer) // 4), dtype=self._buffer.dtype)
+            buffer[:self.size] = self.values
+            self._buffer = buffer
+        self._buffer[self.size:size] = values
+        self.size = size
+
+    def truncate(self, size: int) -> None:
+        self.size = size
+
+
+class NumpyBackend(CountingBackend):
+    """
+    Backend encoding the corpus as arrays of token ids, with all its (word, context) pairs precomputed as two parallel
+    arrays of word ids and context ids. The kernels are then vectorized masked counts over these arrays. The encoding
+    is computed on the first use of a kernel, and extended by the pairs of the appended words when the corpus is
+    extended.
+
+    The contexts are kept only as their integer keys, sorted per context type. The `Context` objects are created when
+    the kernels return them, so that the backend does not hold an object for every distinct context of the corpus. The
+    contexts first occurring in the appended words get the next ids, their keys are kept in a dictionary.
+    """
+    name = "numpy"
+
+    vocabulary: list[str]
+    word_ids: dict[str, int]
+    suffix_vocabulary: list[str]
+    suffix_ids: dict[str, int]
+    context_count: int
+    context_offsets: list[int]
+    context_keys: list[np.ndarray]
+
+    def __init__(self, corpus: Sequence[str], context_types: Sequence[ContextType], start: int = 0,
+                 stop: Optional[int] = None) -> None:
+        super().__init__(corpus, context_types, start=start, stop=stop)
+        self._prepared = False
+
+    @property
+    def pair_words(self) -> np.ndarray:
+        return self._pair_words.values
+
+    @property
+    def pair_contexts(self) -> np.ndarray:
+        return self._pair_contexts.values
+
+    def _prepare(self) -> None:
+        if self._prepared:
+            return
+
+        # Intern the corpus, a token corpus is already interned
+        if isinstance(self.corpus, TokenCorpus):
+            self.vocabulary = self.corpus.vocabulary
+            corpus_ids = np.frombuffer(self.corpus.ids, dtype=np.uint32).astype(np.int64)
+            self.word_ids = {word: word_id for word_id, word in enumerate(self.vocabulary)}
+        else:
+            self.word_ids = dict()
+            self.vocabulary = []
+            corpus_ids = self._intern(self.corpus)
+
+        # Suffix of every word of the vocabulary, interned in the same way
+        self.suffix_ids = dict()
+        self.suffix_vocabulary = []
+        self._word_suffix_ids = GrowingArray(np.zeros(0, dtype=np.int64))
+        self._intern_suffixes()
+
+        self.context_offsets, self.context_keys = [], []
+        self.context_count = 0
+        positions_per_type, words_per_type, contexts_per_type = [], [], []
+        for type_index, (positions, words, keys) in enumerate(self._encode(corpus_ids, offset=0, start=self.start,
+                                                                           stop=self.stop)):
+            unique_keys, inverse = np.unique(keys, return_inverse=True)
+            self.context_offsets.append(self.context_count)
+            self.context_keys.append(unique_keys)
+            positions_per_type.append(positions)
+            # The pairs are the largest part of the encoding, kept as 32-bit ids
+            words_per_type.append(words.astype(np.int32))
+            contexts_per_type.append((inverse.reshape(-1) + self.context_count).astype(np.int32))
+            self.context_count += len(unique_keys)
+
+        # The contexts first occurring in the appended words, see `_get_context_ids`
+        self._base_context_count = self.context_count
+        self._appended_contexts = []
+        self._appended_context_ids = dict()
+
+        self._pair_words = GrowingArray(np.zeros(0, dtype=np.int32))
+        self._pair_contexts = GrowingArray(np.zeros(0, dtype=np.int32))
+        self._last_position_pairs = 0
+        self._append_pairs(positions_per_type, words_per_type, contexts_per_type, stop=self.stop)
+        self._prepared = True
+
+    def _intern(self, tokens: Sequence[str]) -> np.ndarray:
+        """
+        Intern the given tokens, adding the new ones to the vocabulary.
+        """
+        ids = np.empty(len(tokens), dtype=np.int64)
+        for i, word in enumerate(tokens):
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                word_id = self.word_ids[word] = len(self.vocabulary)
+                self.vocabulary.append(word)
+            ids[i] = word_id
+        return ids
+
+    def _intern_suffixes(self) -> None:
+        """
+        Intern the suffixes of the words added to the vocabulary since the last call.
+        """
+        word_suffix_ids = np.empty(len(self.vocabulary) - self._word_suffix_ids.size, dtype=np.int64)
+        for i, word in enumerate(self.vocabulary[self._word_suffix_ids.size:]):
+            suffix = word[-SUFFIX_LENGTH:]
+            suffix_id = self.suffix_ids.get(suffix)
+            if suffix_id is None:
+                suffix_id = self.suffix_ids[suffix] = len(self.suffix_vocabulary)
+                self.suffix_vocabulary.append(suffix)
+            word_suffix_ids[i] = suffix_id
+        self._word_suffix_ids.extend(word_suffix_ids)
+
+    def _encode(self, corpus_ids: np.ndarray, offset: int, start: int,
+                stop: int) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        For every context type, encode the (word, context) pairs of the words at the positions from `start` to `stop`.
+        :param corpus_ids: Ids of the tokens of the corpus from the position `offset` to its end.
+        :return: For every context type, the positions of the words, the ids of the words and the keys of the contexts.
+        """
+        size = offset + len(corpus_ids)
+        word_suffix_ids = self._word_suffix_ids.values
+        for context_type in self.context_types:
+            uses_left, uses_right, uses_suffix = CONTEXT_TYPE_SHAPES[context_type]
+            positions = np.arange(max(start, 1) if uses_left else start,
+                                  min(stop, size - 1) if uses_right else stop)
+            left = corpus_ids[positions - offset - 1] if uses_left else None
+            right = corpus_ids[positions - offset + 1] if uses_right else None
+            if uses_suffix:
+                left = word_suffix_ids[left] if uses_left else None
+                right = word_suffix_ids[right] if uses_right else None
+
+            # Encode the context as a single integer
+            if uses_left and uses_right:
+                keys = left.astype(np.uint64) * np.uint64(KEY_BASE) + right.astype(np.uint64)
+            else:
+                keys = (left if uses_left else right).astype(np.uint64)
+            yield positions, corpus_ids[positions - offset], keys
+
+    def _append_pairs(self, positions_per_type: list[np.ndarray], words_per_type: list[np.ndarray],
+                      contexts_per_type: list[np.ndarray], stop: int) -> None:
+        """
+        Append the encoded pairs of words following the already encoded ones, ordered by the position of the word and
+        then by the order of the context types, as the reference backend does.
+        :param stop: Position after the last encoded word.
+        """
+        order = np.argsort(np.concatenate([positions * len(self.context_types) + type_index
+                                           for type_index, positions in enumerate(positions_per_type)]), kind="stable")
+        self._pair_words.extend(np.concatenate(words_per_type)[order])
+        self._pair_contexts.extend(np.concatenate(contexts_per_type)[order])
+        self._last_position_pairs = sum(int(np.count_nonzero(positions == stop - 1))
+                                        for positions in positions_per_type)
+
+    def extend(self, context_frequencies: MutableMapping[Context, Frequency],
+               noun_frequencies: MutableMapping[str, Frequency], all_nouns: set[str], masc_nouns: set[str],
+               fem_nouns: set[str], masc_contexts: set[Context], fem_contexts: set[Context]) -> \
+            tuple[set[Context], set[str]]:
+        if self._prepared:
+            self._extend_encoding()
+        return super().extend(context_frequencies=context_frequencies, noun_frequencies=noun_frequencies,
+                              all_nouns=all_nouns, masc_nouns=masc_nouns, fem_nouns=fem_nouns,
+                              masc_contexts=masc_contexts, fem_contexts=fem_contexts)
+
+    def _extend_encoding(self) -> None:
+        """
+        Encode the pairs of the words appended to the corpus. The last word before the extension gets new right and
+        bilateral contexts, so its pairs are encoded again.
+        """
+        first = max(self.stop - 1, self.start)
+        window_start = max(first - 1, 0)
+        if isinstance(self.corpus, TokenCorpus):
+            # The vocabulary of the backend is the one of the corpus, which has been extended
+            for word_id in range(len(self.word_ids), len(self.vocabulary)):
+                self.word_ids[self.vocabulary[word_id]] = word_id
+            corpus_ids = np.frombuffer(self.corpus.ids, dtype=np.uint32)[window_start:].astype(np.int64)
+        else:
+            corpus_ids = self._intern(self.corpus[window_start:])
+        self._intern_suffixes()
+
+        if first == self.stop - 1:
+            self._pair_words.truncate(self._pair_words.size - self._last_position_pairs)
+            self._pair_contexts.truncate(self._pair_contexts.size - self._last_position_pairs)
+
+        positions_per_type, words_per_type, contexts_per_type = [], [], []
+        for type_index, (positions, words, keys) in enumerate(self._encode(corpus_ids, offset=window_start,
+                                                                           start=first, stop=len(self.corpus))):
+            positions_per_type.append(positions)
+            words_per_type.append(words.astype(np.int32))
+            contexts_per_type.append(self._get_context_ids(type_index, keys).astype(np.int32))
+        self._append_pairs(positions_per_type, words_per_type, contexts_per_type, stop=len(self.corpus))
+
+    def _get_context_ids(self, type_index: int, keys: np.ndarray) -> np.ndarray:
+        """
+        Find the ids of the contexts of the given type and keys, giving the next ids to the contexts not yet present.
+        """
+        context_keys = self.context_keys[type_index]
+        indices = np.searchsorted(context_keys, keys)
+        found = indices < len(context_keys)
+        found[found] = context_keys[indices[found]] == keys[found]
+        context_ids = indices + self.context_offsets[type_index]
+        for i in np.flatnonzero(~found).tolist():
+            appended_key = (type_index, int(keys[i]))
+            context_id = self._appended_context_ids.get(appended_key)
+            if context_id is None:
+                context_id = self._appended_context_ids[appended_key] = self.context_count
+                self._appended_contexts.append(appended_key)
+                self.context_count += 1
+            context_ids[i] = context_id
+        return context_ids
+
+    def _get_context(self, context_id: int) -> Context:
+        if context_id < self._base_context_count:
+            type_index = bisect.bisect_right(self.context_offsets, context_id) - 1
+            key = int(self.context_keys[type_index][context_id - self.context_offsets[type_index]])
+        else:
+            type_index, key = self._appended_contexts[context_id - self._base_context_count]
+        context_type = self.context_types[type_index]
+
+        uses_left, uses_right, uses_suffix = CONTEXT_TYPE_SHAPES[context_type]
+        parts_vocabulary = self.suffix_vocabulary if uses_suffix else self.vocabulary
+        left_part, right_part = None, None
+        if uses_left and uses_right:
+            left_part = parts_vocabulary[key // KEY_BASE]
+            right_part = parts_vocabulary[key % KEY_BASE]
+        elif uses_left:
+            left_part = parts_vocabulary[key]
+        else:
+            right_part = parts_vocabulary[key]
+        return Context(context_type=context_type, left=left_part, right=right_part)
+
+    def _get_context_id(self, context: Context) -> Optional[int]:
+        """
+        Find the id of the given context, None if the context does not occur in the counted part of the corpus.
+        """
+        if context.context_type not in self.context_types:
+            return None
+        type_index = self.context_types.index(context.context_type)
+        uses_left, uses_right, uses_suffix = CONTEXT_TYPE_SHAPES[context.context_type]
+        part_ids = self.suffix_ids if uses_suffix else self.word_ids
+        left = part_ids.get(context.left) if uses_left else 0
+        right = part_ids.get(context.right) if uses_right else 0
+        if left is None or right is None:
+            return None
+
+        if uses_left and uses_right:
+            key = left * KEY_BASE + right
+        else:
+            key = left if uses_left else right
+        keys = self.context_keys[type_index]
+        index = int(np.searchsorted(keys, key))
+        if index == len(keys) or keys[index] != key:
+            return self._appended_context_ids.get((type_index, key))
+        return self.context_offsets[type_index] + index
+
+    def _get_word_flags(self, words: set[str]) -> np.ndarray:
+        flags = np.zeros(len(self.vocabulary), dtype=np.bool_)
+        ids = [self.word_ids[word] for word in words if word in self.word_ids]
+        flags[ids] = True
+        return flags
+
+    def _get_context_flags(self, contexts: set[Context]) -> np.ndarray:
+        flags = np.zeros(self.context_count, dtype=np.bool_)
+        ids = [context_id for context_id in map(self._get_context_id, contexts) if context_id is not None]
+        flags[ids] = True
+        return flags
+
+    def _count_contexts_of_words(self, is_new_word: np.ndarray,
+                                 is_masc_word: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        For every context, count its pairs with the new masculine and with the new feminine words.
+        """
+        mask = is_new_word[self.pair_words]
+        contexts = self.pair_contexts[mask]
+        is_masc = is_masc_word[self.pair_words[mask]]
+        masc = np.bincount(contexts[is_masc], minlength=self.context_count)
+        fem = np.bincount(contexts[~is_masc], minlength=self.context_count)
+        return masc, fem
+
+    def _count_words_of_contexts(self, is_new_context: np.ndarray, is_masc_context: np.ndarray,
+                                 is_noun: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        For every word which is a noun, count its pairs with the new masculine and with the new feminine contexts.
+        """
+        mask = is_new_context[self.pair_contexts] & is_noun[self.pair_words]
+        words = self.pair_words[mask]
+        is_masc = is_masc_context[self.pair_contexts[mask]]
+        masc = np.bincount(words[is_masc], minlength=len(self.vocabulary))
+        fem = np.bincount(words[~is_masc], minlength=len(self.vocabulary))
+        return masc, fem
+
+    def iterate_over_words_and_contexts(self) -> Iterator[tuple[str, Context]]:
+        self._prepare()
+        for word_id, context_id in zip(self.pair_words.tolist(), self.pair_contexts.tolist()):
+            yield self.vocabulary[word_id], self._get_context(context_id)
+
+    def get_initial_gender_frequencies_of_contexts(
+            self,
+            frequencies: Optional[MutableMapping[Context, Frequency]] = None) -> MutableMapping[Context, Frequency]:
+        self._prepare()
+        frequencies = dict() if frequencies is None else frequencies
+        counts = np.bincount(self.pair_contexts, minlength=self.context_count)
+        for context_id, count in enumerate(counts.tolist()):
+            frequencies[self._get_context(context_id)] = Frequency(quest=count, masc=0, fem=0)
+        return frequencies
+
+    def update_frequencies_and_get_updated_contexts(self, context_frequencies: MutableMapping[Context, Frequency],
+                                                    all_new_nouns: set[str], new_masc_nouns: set[str]) -> set[Context]:
+        self._prepare()
+        masc, fem = self._count_contexts_of_words(is_new_word=self._get_word_flags(all_new_nouns),
+                                                  is_masc_word=self._get_word_flags(new_masc_nouns))
+
+        context_ids = np.flatnonzero(masc + fem).tolist()
+        contexts = [self._get_context(context_id) for context_id in context_ids]
+        prefetch(context_frequencies, contexts)
+        for context_id, context in zip(context_ids, contexts):
+            context_frequency = context_frequencies[context]
+            masc_count, fem_count = int(masc[context_id]), int(fem[context_id])
+            context_frequency.quest -= masc_count + fem_count
+            context_frequency.masc += masc_count
+            context_frequency.fem += fem_count
+
+        return set(contexts)
+
+    def update_noun_frequencies_and_get_updated_words(self, all_new_contexts: set[Context], all_nouns: set[str],
+                                                      noun_frequencies: MutableMapping[str, Frequency],
+                                                      new_masc_contexts: set[Context]) -> set[str]:
+        self._prepare()
+        masc, fem = self._count_words_of_contexts(is_new_context=self._get_context_flags(all_new_contexts),
+                                                  is_masc_context=self._get_context_flags(new_masc_contexts),
+                                                  is_noun=self._get_word_flags(all_nouns))
+
+        updated_words = set()
+        word_ids = np.flatnonzero(masc + fem).tolist()
+        prefetch(noun_frequencies, [self.vocabulary[word_id] for word_id in word_ids])
+        for word_id in word_ids:
+            word = self.vocabulary[word_id]
+            noun_frequency = noun_frequencies[word]
+            masc_count, fem_count = int(masc[word_id]), int(fem[word_id])
+            noun_frequency.quest -= masc_count + fem_count
+            noun_frequency.masc += masc_count
+            noun_frequency.fem += fem_count
+            updated_words.add(word)
+
+        return updated_words
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import random
+import sys
+from multiprocessing.connection import Connection
+from typing import Sequence, Optional
+
+from bootstrapping.backends import BACKENDS, CountingBackend, get_backend, is_backend_available
+from bootstrapping.bootstrapping import ALLOWED_CONTEXT_MODELS, bootstrap, bootstrap_with_backend
+from bootstrapping.distributed import DistributedBackend, local_workers, parse_address, remote_workers
+from evidence_modeling.evidence_modeling import get_initial_gender_frequencies
+from evidence_modeling.gender_predictor import GenderPredictor
+
+# Memory budget of the frequency tables spilling to the disk, small enough for the tables of the synthetic corpora
+SPILLING_MEMORY_BUDGET_MB = 0.05
+
+# Number of tokens of a sentence of the synthetic corpora
+SENTENCE_LENGTH = 5
+
+
+def generate_synthetic_corpus(seed: int, length: int = 3000, nouns: int = 60, other_words: int = 40) -> \
+        tuple[list[str], set[str], set[str], set[str]]:
+    """
+    Generate a random corpus in which masculine and feminine nouns tend to follow different determiners and
+    adjectives, so that the bootstrapping discovers some nouns and contexts.
+    :param seed: Seed of the random generator.
+    :param length: Approximate number of tokens of the corpus.
+    :param nouns: Number of distinct nouns of each gender.
+    :param other_words: Number of distinct other words.
+    :return: The corpus, the set of all nouns, the masculine seeds and the feminine seeds.
+    """
+    generator = random.Random(seed)
+    masc_nouns = [f"pán{i}" for i in range(nouns)]
+    fem_nouns = [f"žena{i}" for i in range(nouns)]
+    other = [f"slovo{i}" for i in range(other_words)]
+
+    corpus = []
+    while len(corpus) < length:
+        if generator.random() < 0.5:
+            determiner, adjective, noun = "ten", generator.choice(["velký", "starý", "nový"]), masc_nouns
+        else:
+            determiner, adjective, noun = "ta", generator.choice(["velká", "stará", "nová"]), fem_nouns
+        # Some noise, so that the contexts are not perfectly gender specific
+        if generator.random() < 0.1:
+            determiner = generator.choice(["ten", "ta"])
+        corpus += [determiner, adjective, generator.choice(noun), generator.choice(other), "."]
+
+    masc_seeds = set(generator.sample(masc_nouns, 3))
+    fem_seeds = set(generator.sample(fem_nouns, 3))
+    return corpus, set(masc_nouns + fem_nouns), masc_seeds, fem_seeds
+
+
+def check_parity(backend_names: Sequence[str], seeds: Sequence[int], workers: int = 0,
+                 addresses: Sequence[tuple[str, int]] = (), authkey: Optional[bytes] = None) -> list[str]:
+    """
+    Check that the given backends give the same context extraction, counts and bootstrapping outcomes as the reference
+    Python backend, on synthetic corpora generated with the given seeds. Check also that updating a bootstrapped
+    predictor with the last sentence of a corpus gives the same outcome as bootstrapping on the whole corpus.
+    :param backend_names: Names of the backends to check.
+    :param seeds: Seeds of the synthetic corpora.
+    :param workers: If positive, check also the distributed bootstrapping with this number of local workers, using
+    each of the given backends.
+    :param addresses: If given, check the distributed bootstrapping with the workers running `run_worker_server` on
+    these addresses instead of local workers.
+    :param authkey: Shared secret of the remote workers.
+    :return: Descriptions of the differences found, empty if all the backends agree.
+    """
+    if addresses:
+        with remote_workers(addresses, authkey) as connections:
+            return check_parity_of_factories(backend_names, seeds, connections)
+    if workers > 0:
+        with local_workers(workers) as connections:
+            return check_parity_of_factories(backend_names, seeds, connections)
+    return check_parity_of_factories(backend_names, seeds, connections=None)
+
+
+def check_parity_of_factories(backend_names: Sequence[str], seeds: Sequence[int],
+                              connections: Optional[Sequence[Connection]]) -> list[str]:
+    factories = []
+    for name in backend_names:
+        # The memory budget is used only by the distributed backend, whose workers hold their own context tables
+        factories.append((name, lambda corpus, start=0, stop=None, memory_budget_mb=None, name=name: get_backend(
+            name, corpus=corpus, context_types=ALLOWED_CONTEXT_MODELS, start=start, stop=stop)))
+        if connections is not None:
+            factories.append((f"distributed {name}", lambda corpus, start=0, stop=None, memory_budget_mb=None,
+                              name=name: DistributedBackend(corpus, context_types=ALLOWED_CONTEXT_MODELS,
+                                                            connections=connections, counting_backend=name,
+                                                            start=start, stop=stop,
+                                                            memory_budget_mb=memory_budget_mb)))
+
+    differences = []
+    for seed in seeds:
+        corpus, nouns, masc_seeds, fem_seeds = generate_synthetic_corpus(seed)
+        reference = get_backend("python", corpus=corpus, context_types=ALLOWED_CONTEXT_MODELS)
+        reference_pairs = list(reference.iterate_over_words_and_contexts())
+        reference_counts = reference.get_initial_gender_frequencies_of_contexts()
+        frequencies = get_initial_gender_frequencies(noun_set=nouns, unannotated_corpus=corpus,
+                                                     masc_seeds=masc_seeds, fem_seeds=fem_seeds)
+        with contextlib.redirect_stdout(io.StringIO()):
+            reference_state = bootstrap(masc_seeds=masc_seeds, fem_seeds=fem_seeds, all_nouns=nouns,
+                                        unannotated_corpus=corpus, original_frequencies=frequencies,
+                                        counting_backend="python")
+
+        for name, make_backend in factories:
+            # Counting only a part of the corpus, as a worker of the distributed bootstrapping does (first, as a
+            # distributed backend takes over the workers of the previous one)
+            start, stop = len(corpus) // 3, 2 * len(corpus) // 3
+            reference_part = get_backend("python", corpus=corpus, context_types=ALLOWED_CONTEXT_MODELS, start=start,
+                                         stop=stop)
+            backend_part = make_backend(corpus, start=start, stop=stop)
+            if backend_part.get_initial_gender_frequencies_of_contexts() != \
+                    reference_part.get_initial_gender_frequencies_of_contexts():
+                differences.append(f"{name}, corpus {seed}: different initial counts of contexts of a part")
+
+            backend: CountingBackend = make_backend(corpus)
+            if list(backend.iterate_over_words_and_contexts()) != reference_pairs:
+                differences.append(f"{name}, corpus {seed}: different (word, context) pairs")
+            if backend.get_initial_gender_frequencies_of_contexts() != reference_counts:
+                differences.append(f"{name}, corpus {seed}: different initial counts of contexts")
+
+            # Counting the first half of the corpus, and extending it by the second half
+            extended_corpus = corpus[:len(corpus) // 2]
+            extended_backend = make_backend(extended_corpus)
+            context_frequencies = extended_backend.get_initial_gender_frequencies_of_contexts()
+            extended_corpus.extend(corpus[len(corpus) // 2:])
+            extended_backend.extend(context_frequencies=context_frequencies, noun_frequencies=dict(), all_nouns=nouns,
+                                    masc_nouns=set(), fem_nouns=set(), masc_contexts=set(), fem_contexts=set())
+            if list(extended_backend.iterate_over_words_and_contexts()) != reference_pairs:
+                differences.append(f"{name}, corpus {seed}: different (word, context) pairs of an extended corpus")
+            if context_frequencies != reference_counts:
+                differences.append(f"{name}, corpus {seed}: different initial counts of contexts of an extended corpus")
+
+            # Single kernel calls on a frontier of a few nouns and of the contexts they occur in
+            frontier_nouns = masc_seeds | fem_seeds
+            frontier_contexts = {context for word, context in reference_pairs if word in frontier_nouns}
+            frontier_masc_contexts = {context for word, context in reference_pairs if word in masc_seeds}
+            for kernel_backend in [reference, backend]:
+                context_frequencies = kernel_backend.get_initial_gender_frequencies_of_contexts()
+                updated_contexts = kernel_backend.update_frequencies_and_get_updated_contexts(
+                    context_frequencies=context_frequencies, all_new_nouns=frontier_nouns, new_masc_nouns=masc_seeds)
+                noun_frequencies = get_initial_gender_frequencies(noun_set=nouns, unannotated_corpus=corpus,
+                                                                  masc_seeds=masc_seeds, fem_seeds=fem_seeds)
+                updated_words = kernel_backend.update_noun_frequencies_and_get_updated_words(
+                    all_new_contexts=frontier_contexts, all_nouns=nouns, noun_frequencies=noun_frequencies,
+                    new_masc_contexts=frontier_masc_contexts)
+                if kernel_backend is reference:
+                    expected = (context_frequencies, updated_contexts, noun_frequencies, updated_words)
+                elif (context_frequencies, updated_contexts, noun_frequencies, updated_words) != expected:
+                    differences.append(f"{name}, corpus {seed}: different frequency updates")
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                state = bootstrap_with_backend(masc_seeds=masc_seeds, fem_seeds=fem_seeds, all_nouns=nouns,
+                                               backend=make_backend(corpus), original_frequencies=frequencies)
+            if state != reference_state:
+                differences.append(f"{name}, corpus {seed}: different bootstrapping outcome")
+
+            # The same with the frequency tables spilling almost all their entries to the disk
+            with contextlib.redirect_stdout(io.StringIO()):
+                state = bootstrap_with_backend(masc_seeds=masc_seeds, fem_seeds=fem_seeds, all_nouns=nouns,
+                                               backend=make_backend(corpus, memory_budget_mb=SPILLING_MEMORY_BUDGET_MB),
+                                               original_frequencies=frequencies,
+                                               memory_budget_mb=SPILLING_MEMORY_BUDGET_MB)
+            if state != reference_state:
+                differences.append(f"{name}, corpus {seed}: different bootstrapping outcome with spilling tables")
+
+        # A sentence added to a bootstrapped predictor decides only the contexts and nouns it makes pass the initial
+        # threshold, which is what a full bootstrapping decides, unless the sentence changes its earlier decisions
+        for name in dict.fromkeys(["python", *backend_names]):
+            for workers in [None] if connections is None else [None, connections]:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    predictor = GenderPredictor(masc_seeds=masc_seeds, fem_seeds=fem_seeds, nouns=nouns,
+                                                unannotated_corpus=corpus[:-SENTENCE_LENGTH], counting_backend=name)
+                    predictor.bootstrap_from_context(workers=workers)
+                    predictor.update_with_corpus(corpus[-SENTENCE_LENGTH:])
+                if predictor.bootstrapping_state != reference_state:
+                    differences.append(f"{'' if workers is None else 'distributed '}{name}, corpus {seed}: different "
+                                       f"outcome of updating the bootstrapping")
+
+    return differences
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that the counting backends agree with the reference one.")
+    parser.add_argument("--backends", nargs="+", default=None,
+                        help="Backends to check, all the available ones except the reference one by default.")
+    parser.add_argument("--corpora", type=int, default=5, help="Number of synthetic corpora.")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Check also the distributed bootstrapping with this number of local workers.")
+    parser.add_argument("--connect", nargs="+", default=[], metavar="HOST:PORT",
+                        help="Check also the distributed bootstrapping with the workers running on these addresses "
+                             "(see `python -m bootstrapping.distributed`) instead of local workers.")
+    parser.add_argument("--authkey", default=None, help="Shared secret of the remote workers.")
+    args = parser.parse_args()
+    if args.connect and args.authkey is None:
+        parser.error("--connect requires --authkey")
+
+    backend_names = args.backends
+    if backend_names is None:
+        # The backends with optional dependencies are skipped when not installed, unless explicitly selected
+        backend_names = []
+        for name in BACKENDS:
+            if name == "python":
+                continue
+            if is_backend_available(name):
+                backend_names.append(name)
+            else:
+                print(f"Skipping the counting backend '{name}', its dependencies are not installed")
+
+    differences = check_parity(backend_names, seeds=range(args.corpora), workers=args.workers,
+                               addresses=[parse_address(address) for address in args.connect],
+                               authkey=args.authkey.encode("utf-8") if args.connect else None)
+    for difference in differences:
+        print(difference)
+    print(f"{len(differences)} differences found.")
+    sys.exit(1 if differences else 0)
+
+
+if __name__ == "__main__":
+    main()
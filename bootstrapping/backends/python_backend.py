@@ -0,0 +1,171 @@
+from typing import Sequence, Iterator, Optional, MutableMapping
+
+from bootstrapping.backends.base import CountingBackend
+from bootstrapping.contexts import ContextType, Context
+from evidence_modeling.frequency import Frequency
+
+
+class PythonBackend(CountingBackend):
+    """
+    Reference pure-Python backend, iterating over the corpus token by token.
+    """
+    name = "python"
+
+    def iterate_over_words_and_contexts(self) -> Iterator[tuple[str, Context]]:
+        return iterate_over_words_and_contexts(corpus=self.corpus, context_types=self.context_types, start=self.start,
+                                               stop=self.stop)
+
+    def get_initial_gender_frequencies_of_contexts(
+            self,
+            frequencies: Optional[MutableMapping[Context, Frequency]] = None) -> MutableMapping[Context, Frequency]:
+        return get_initial_gender_frequencies_of_contexts(unannotated_corpus=self.corpus,
+                                                          allowed_context_types=self.context_types,
+                                                          start=self.start, stop=self.stop, frequencies=frequencies)
+
+    def update_frequencies_and_get_updated_contexts(self, context_frequencies: MutableMapping[Context, Frequency],
+                                                    all_new_nouns: set[str], new_masc_nouns: set[str]) -> set[Context]:
+        return update_frequencies_and_get_updated_contexts(unannotated_corpus=self.corpus,
+                                                           context_types=self.context_types,
+                                                           context_frequencies=context_frequencies,
+                                                           all_new_nouns=all_new_nouns,
+                                                           new_masc_nouns=new_masc_nouns,
+                                                           start=self.start, stop=self.stop)
+
+    def update_noun_frequencies_and_get_updated_words(self, all_new_contexts: set[Context], all_nouns: set[str],
+                                                      noun_frequencies: MutableMapping[str, Frequency],
+                                                      new_masc_contexts: set[Context]) -> set[str]:
+        return update_noun_frequencies_and_get_updated_words(unannotated_corpus=self.corpus,
+                                                             context_types=self.context_types,
+                                                             all_new_contexts=all_new_contexts,
+                                                             all_nouns=all_nouns,
+                                                             noun_frequencies=noun_frequencies,
+                                                             new_masc_contexts=new_masc_contexts,
+                                                             start=self.start, stop=self.stop)
+
+
+def iterate_over_words_and_contexts(
+        corpus: Sequence[str],
+        context_types: Sequence[ContextType],
+        start: int = 0,
+        stop: Optional[int] = None) -> Iterator[tuple[str, Context]]:
+    """
+    For given corpus and set of context types, iterate over all pairs (word, context of the word), for the words at the
+    positions from `start` to `stop` (the whole corpus by default).
+    """
+    for i in range(start, len(corpus) if stop is None else stop):
+        for context_type in context_types:
+            context = Context.get_from_corpus_index(context_type=context_type, corpus=corpus, index=i)
+            word = corpus[i]
+            if context is not None:
+                yield word, context
+
+
+def get_initial_gender_frequencies_of_contexts(
+        unannotated_corpus: Sequence[str],
+        allowed_context_types: Sequence[ContextType],
+        start: int = 0,
+        stop: Optional[int] = None,
+        frequencies: Optional[MutableMapping[Context, Frequency]] = None) -> MutableMapping[Context, Frequency]:
+    """
+    For a given unannotated corpus and allowed types of contexts, extract all contexts present in the unannotated corpus
+    and initialize their counts.
+    :param allowed_context_types:
+    :param unannotated_corpus: Unannotated corpus for computing the absolute counts.
+    :param start: Position of the first word to count.
+    :param stop: Position after the last word to count, the end of the corpus by default.
+    :param frequencies: Empty table to count the contexts into (e.g. a `SpillingFrequencyTable`), a new dictionary by
+    default.
+    :return: Dictionary of frequencies.
+    """
+    frequencies = dict() if frequencies is None else frequencies
+    positions = range(start, len(unannotated_corpus) if stop is None else stop)
+
+    # The contexts are counted directly in the table, without collecting them first, so that only the table needs to
+    # fit into the memory
+    for context_type in allowed_context_types:
+        for i in positions:
+            context = Context.get_from_corpus_index(context_type=context_type, corpus=unannotated_corpus, index=i)
+            # the positions without a context of the given type are not counted
+            if context is None:
+                continue
+            frequency = frequencies.get(context)
+            if frequency is None:
+                frequencies[context] = Frequency(quest=1, masc=0, fem=0)
+            else:
+                frequency.quest += 1
+
+    return frequencies
+
+
+def update_frequencies_and_get_updated_contexts(
+        unannotated_corpus: Sequence[str],
+        context_types: Sequence[ContextType],
+        context_frequencies: MutableMapping[Context, Frequency],
+        all_new_nouns: set[str],
+        new_masc_nouns: set[str],
+        start: int = 0,
+        stop: Optional[int] = None
+) -> set[Context]:
+    """
+    Go through the corpus, and on every newly added noun update the counts of the corresponding contexts. Modifies the
+    given context frequencies dictionary.
+    :param unannotated_corpus: Sequence of words, unannotated corpus.
+    :param context_types: Types of the contexts to consider.
+    :param new_masc_nouns:
+    :param all_new_nouns:
+    :param context_frequencies:
+    :param start: Position of the first word to count.
+    :param stop: Position after the last word to count, the end of the corpus by default.
+    :return: The set of updated contexts.
+    """
+
+    updated_contexts = set()
+    for current_word, context in iterate_over_words_and_contexts(corpus=unannotated_corpus,
+                                                                 context_types=context_types, start=start, stop=stop):
+        if current_word in all_new_nouns:
+            context_frequency = context_frequencies[context]
+            context_frequency.quest -= 1
+            if current_word in new_masc_nouns:
+                context_frequency.masc += 1
+            else:
+                context_frequency.fem += 1
+            updated_contexts.add(context)
+
+    return updated_contexts
+
+
+def update_noun_frequencies_and_get_updated_words(
+        unannotated_corpus: Sequence[str],
+        context_types: Sequence[ContextType],
+        all_new_contexts: set[Context],
+        all_nouns: set[str],
+        noun_frequencies: MutableMapping[str, Frequency],
+        new_masc_contexts: set[Context],
+        start: int = 0,
+        stop: Optional[int] = None
+) -> set[str]:
+    """
+    Updates the noun frequencies, based on new contexts.
+    :param unannotated_corpus: Sequence of words, unannotated corpus.
+    :param context_types: Types of the contexts to consider.
+    :param all_new_contexts: All new contexts (fem and masc)
+    :param all_nouns: Set of all tokens considered to be nouns.
+    :param noun_frequencies: Is modified in place.
+    :param new_masc_contexts: New masc contexts.
+    :param start: Position of the first word to count.
+    :param stop: Position after the last word to count, the end of the corpus by default.
+    :return: set of updated words
+    """
+    updated_words = set()
+    for word, context in iterate_over_words_and_contexts(corpus=unannotated_corpus,
+                                                         context_types=context_types, start=start, stop=stop):
+        if context in all_new_contexts and word in all_nouns:
+            noun_frequency = noun_frequencies[word]
+            noun_frequency.quest -= 1
+            if context in new_masc_contexts:
+                noun_frequency.masc += 1
+            else:
+                noun_frequency.fem += 1
+            updated_words.add(word)
+
+    return updated_words
@@ -1,14 +1,21 @@
-from typing import Sequence, Optional, Iterator
-from collections import Counter
+from typing import Sequence, Optional, MutableMapping
+from dataclasses import dataclass, field
 import copy
 
+from config import COUNTING_BACKEND, FREQUENCY_TABLE_MEMORY_BUDGET_MB
 from evidence_modeling.frequency import Frequency
+from bootstrapping.backends import CountingBackend, get_backend
 from bootstrapping.contexts import ContextType, Context
 from gender import Gender
+from storage.frequency_table import create_frequency_table, prefetch
 
 ALLOWED_CONTEXT_MODELS = [ContextType.LEFT_WHOLE_WORD, ContextType.RIGHT_WHOLE_WORD, ContextType.BILATERAL_WHOLE_WORD,
                           ContextType.LEFT_SUFFIX, ContextType.RIGHT_SUFFIX, ContextType.BILATERAL_SUFFIX]
 
+# The fraction every iteration starts deciding the contexts and nouns with, see `is_context_gender_specific`. It is
+# decreased in the iteration only until something is decided.
+INITIAL_FRACTION_TO_ALLOW = 0.5
+
 
 def is_context_gender_specific_strict(masc: int, fem: int, quest: int, fraction_to_allow: float) -> Optional[Gender]:
     """
@@ -88,19 +95,25 @@ def is_context_gender_specific(context_frequency: Frequency, fraction_to_allow:
 
 def extract_relevant_contexts(
         updated_contexts: set[Context],
-        context_frequencies: dict[Context, Frequency]) -> tuple[set[Context], set[Context]]:
+        context_frequencies: MutableMapping[Context, Frequency],
+        fraction_to_allow: Optional[float] = None) -> tuple[set[Context], set[Context]]:
     """
     Extract relevant contexts by iteratively descreasing the treshold until some contexts are considered relevant.
     :param updated_contexts: Contexts that have been updated in the last run.
     :param context_frequencies:
+    :param fraction_to_allow: If given, only the contexts relevant with this fixed fraction are extracted, without
+    decreasing the threshold.
     :return:
     """
     new_masc_contexts = set()
     new_fem_contexts = set()
 
+    prefetch(context_frequencies, updated_contexts)
+
     # Iteratively decrease the weight determining which contexts will be considered relevant, until at least one
     # relevant context is found.
-    fraction_to_allow = 0.5
+    relax = fraction_to_allow is None
+    fraction_to_allow = INITIAL_FRACTION_TO_ALLOW if relax else fraction_to_allow
     added = False
     while not added:
         for context in updated_contexts:
@@ -112,6 +125,9 @@ def extract_relevant_contexts(
                 new_fem_contexts.add(context)
                 added = True
 
+        if not relax:
+            break
+
         # decrease the weight a little bit
         fraction_to_allow /= 1.2
 
@@ -127,47 +143,22 @@ def extract_relevant_contexts(
     return new_masc_contexts, new_fem_contexts
 
 
-def update_frequencies_and_get_updated_contexts(
-        context_frequencies: dict[Context, Frequency],
-        all_new_nouns: set[str],
-        new_masc_nouns: set[str]
-) -> set[Context]:
-    """
-    Go through the corpus, and on every newly added noun update the counts of the corresponding contexts. Modifies the
-    given context frequencies dictionary.
-    :param new_masc_nouns:
-    :param all_new_nouns:
-    :param context_frequencies:
-    :return: The set of updated contexts.
-    """
-
-    updated_contexts = set()
-    for current_word, context in iterate_over_words_and_contexts(corpus=unannotated_corpus,
-                                                                 context_types=ALLOWED_CONTEXT_MODELS):
-        if current_word in all_new_nouns:
-            context_frequency = context_frequencies[context]
-            context_frequency.quest -= 1
-            if current_word in new_masc_nouns:
-                context_frequency.masc += 1
-            else:
-                context_frequency.fem += 1
-            updated_contexts.add(context)
-
-    return updated_contexts
-
-
-def extract_relevant_masc_fem_nouns(updated_words: set[str], noun_frequencies: dict[str, Frequency]) -> tuple[
-    set[str], set[str]]:
+def extract_relevant_masc_fem_nouns(updated_words: set[str], noun_frequencies: MutableMapping[str, Frequency],
+                                    fraction_to_allow: Optional[float] = None) -> tuple[set[str], set[str]]:
     """
     Extract relevant masculine and feminine nouns.
     :param updated_words:
     :param noun_frequencies:
+    :param fraction_to_allow: If given, only the nouns relevant with this fixed fraction are extracted, without
+    decreasing the threshold.
     :return:
     """
     new_masc_nouns = set()
     new_fem_nouns = set()
 
-    fraction_to_allow = 0.5
+    prefetch(noun_frequencies, updated_words)
+    relax = fraction_to_allow is None
+    fraction_to_allow = INITIAL_FRACTION_TO_ALLOW if relax else fraction_to_allow
     while not new_fem_nouns | new_masc_nouns:
         for word in updated_words:
             gender = is_context_gender_specific(noun_frequencies[word], fraction_to_allow=fraction_to_allow)
@@ -176,6 +167,9 @@ def extract_relevant_masc_fem_nouns(updated_words: set[str], noun_frequencies: d
             elif gender == Gender.FEMININE:
                 new_fem_nouns.add(word)
 
+        if not relax:
+            break
+
         fraction_to_allow /= 1.2
 
         # stop if too many iterations
@@ -185,40 +179,23 @@ def extract_relevant_masc_fem_nouns(updated_words: set[str], noun_frequencies: d
     return new_masc_nouns, new_fem_nouns
 
 
-def update_noun_frequencies_and_get_updated_words(
-        unannotated_corpus: Sequence[str],
-        all_new_contexts: set[Context],
-        all_nouns: set[str],
-        noun_frequencies: dict[str, Frequency],
-        new_masc_contexts: set[Context]
-) -> set[str]:
+@dataclass
+class BootstrappingState:
     """
-    Updates the noun frequencies, based on new contexts.
-    :param unannotated_corpus: Sequence of words, unannotated corpus.
-    :param all_new_contexts: All new contexts (fem and masc)
-    :param all_nouns: Set of all tokens considered to be nouns.
-    :param noun_frequencies: Is modified in place.
-    :param new_masc_contexts: New masc contexts.
-    :return: set of updated words
+    State of the context bootstrapping, from which the bootstrapping can be resumed after the corpus is extended.
     """
-    updated_words = set()
-    for word, context in iterate_over_words_and_contexts(corpus=unannotated_corpus,
-                                                         context_types=ALLOWED_CONTEXT_MODELS):
-        if context in all_new_contexts and word in all_nouns:
-            noun_frequency = noun_frequencies[word]
-            noun_frequency.quest -= 1
-            if context in new_masc_contexts:
-                noun_frequency.masc += 1
-            else:
-                noun_frequency.fem += 1
-            updated_words.add(word)
-
-    return updated_words
+    noun_frequencies: MutableMapping[str, Frequency]
+    context_frequencies: MutableMapping[Context, Frequency]
+    masc_nouns: set[str]
+    fem_nouns: set[str]
+    masc_contexts: set[Context] = field(default_factory=set)
+    fem_contexts: set[Context] = field(default_factory=set)
 
 
 def update_frequencies_by_bootstrapping(masc_seeds: set[str], fem_seeds: set[str], all_nouns: set[str],
                                         unannotated_corpus: Sequence[str],
-                                        original_frequencies: dict[str, Frequency]) -> \
+                                        original_frequencies: dict[str, Frequency],
+                                        counting_backend: str = COUNTING_BACKEND) -> \
         tuple[set[str], set[str], dict[str, Frequency]]:
     """
     Perform context bootstrapping to get new almost-surely masculine/feminine nouns.
@@ -229,104 +206,147 @@ def update_frequencies_by_bootstrapping(masc_seeds: set[str], fem_seeds: set[str
     :param original_frequencies: The original frequency counts before bootstrapping. The given frequencies are expected
     to correspond to the counts in the given unannotated corpus and to the sets of feminine/masculine seeds. The
     original frequencies are not modified, new frequencies are returned as the third return value.
+    :param counting_backend: Name of the backend of the counting kernels, see `bootstrapping.backends`.
     :return: all masculine nouns, all feminine nouns and updated frequencies.
     """
-    all_masc_nouns = masc_seeds.copy()
-    all_fem_nouns = fem_seeds.copy()
+    state = bootstrap(masc_seeds=masc_seeds, fem_seeds=fem_seeds, all_nouns=all_nouns,
+                      unannotated_corpus=unannotated_corpus, original_frequencies=original_frequencies,
+                      counting_backend=counting_backend)
+    return state.masc_nouns, state.fem_nouns, state.noun_frequencies
 
-    new_masc_nouns = masc_seeds.copy()
-    new_fem_nouns = fem_seeds.copy()
-    noun_frequencies = copy.deepcopy(original_frequencies)
 
-    # Initialize for bootstrapping:
-    context_frequencies = get_initial_gender_frequencies_of_contexts(unannotated_corpus=unannotated_corpus,
-                                                                     allowed_context_types=ALLOWED_CONTEXT_MODELS)
+def bootstrap(masc_seeds: set[str], fem_seeds: set[str], all_nouns: set[str], unannotated_corpus: Sequence[str],
+              original_frequencies: dict[str, Frequency],
+              counting_backend: str = COUNTING_BACKEND,
+              memory_budget_mb: Optional[float] = FREQUENCY_TABLE_MEMORY_BUDGET_MB) -> BootstrappingState:
+    """
+    Perform context bootstrapping, as `update_frequencies_by_bootstrapping`, and return the whole bootstrapping state.
+    """
+    backend = get_backend(counting_backend, corpus=unannotated_corpus, context_types=ALLOWED_CONTEXT_MODELS)
+    return bootstrap_with_backend(masc_seeds=masc_seeds, fem_seeds=fem_seeds, all_nouns=all_nouns, backend=backend,
+                                  original_frequencies=original_frequencies, memory_budget_mb=memory_budget_mb)
+
 
+def bootstrap_with_backend(masc_seeds: set[str], fem_seeds: set[str], all_nouns: set[str], backend: CountingBackend,
+                           original_frequencies: MutableMapping[str, Frequency],
+                           memory_budget_mb: Optional[float] = FREQUENCY_TABLE_MEMORY_BUDGET_MB) -> BootstrappingState:
+    """
+    Perform context bootstrapping, as `bootstrap`, with counting by the given backend over the unannotated corpus.
+    :param memory_budget_mb: Memory budget in MB of each of the noun and context frequency tables of the state. If
+    given, the tables spill the entries exceeding it to the disk (see `storage.frequency_table`), otherwise they are
+    dictionaries.
+    """
+    # Initialize for bootstrapping:
+    noun_frequencies = create_frequency_table(memory_budget_mb)
+    for noun, frequency in original_frequencies.items():
+        noun_frequencies[noun] = copy.copy(frequency)
+    context_frequencies = backend.get_initial_gender_frequencies_of_contexts(create_frequency_table(memory_budget_mb))
+    state = BootstrappingState(
+        noun_frequencies=noun_frequencies,
+        context_frequencies=context_frequencies,
+        masc_nouns=masc_seeds.copy(),
+        fem_nouns=fem_seeds.copy())
+
+    run_bootstrapping(state=state, all_nouns=all_nouns, backend=backend,
+                      new_masc_nouns=masc_seeds.copy(), new_fem_nouns=fem_seeds.copy())
+
+    print(f"Total number of MASC nouns: {len(state.masc_nouns)} (cf. #masc seeds={len(masc_seeds)})")
+    print(f"Total number of FEM nouns: {len(state.fem_nouns)} (cf. #fem seeds={len(fem_seeds)})")
+    print(f"Nouns with unknown gender: {len(all_nouns - state.masc_nouns - state.fem_nouns)}")
+
+    return state
+
+
+def run_bootstrapping(state: BootstrappingState, all_nouns: set[str], backend: CountingBackend,
+                      new_masc_nouns: set[str], new_fem_nouns: set[str],
+                      updated_contexts: Optional[set[Context]] = None,
+                      updated_words: Optional[set[str]] = None,
+                      fraction_to_allow: Optional[float] = None) -> None:
+    """
+    Run the bootstrapping iterations from the given state, until no more nouns are found. Modifies the given state.
+    :param state: The state to start from, the new nouns are expected to be already in its sets of nouns, but not yet
+    counted in its context frequencies.
+    :param all_nouns: Set of all strings from the language to be considered nouns.
+    :param backend: Counting backend over the corpus corresponding to the frequencies of the state.
+    :param new_masc_nouns: Masculine nouns to start the bootstrapping from.
+    :param new_fem_nouns: Feminine nouns to start the bootstrapping from.
+    :param updated_contexts: Contexts whose counts have already changed, to be considered in the first iteration.
+    :param updated_words: Nouns whose counts have already changed, to be considered in the first iteration.
+    :param fraction_to_allow: If given, the contexts and nouns are decided with this fixed fraction, see
+    `is_context_gender_specific`, instead of decreasing it in every iteration until something is decided.
+    """
+    updated_contexts = set() if updated_contexts is None else updated_contexts
+    updated_words = set() if updated_words is None else updated_words
     iteration_no = 0
-    all_new_contexts = set()
 
     # Repeat until no update is performed:
-    while new_masc_nouns | new_fem_nouns:
+    while new_masc_nouns or new_fem_nouns or updated_contexts or updated_words:
         print(f"Bootstrapping: iteration no. {iteration_no} is running...")
         iteration_no += 1
 
         all_new_nouns = new_masc_nouns | new_fem_nouns
 
-        updated_contexts = update_frequencies_and_get_updated_contexts(context_frequencies=context_frequencies,
-                                                                       all_new_nouns=all_new_nouns,
-                                                                       new_masc_nouns=new_masc_nouns)
+        if all_new_nouns:
+            updated_contexts |= backend.update_frequencies_and_get_updated_contexts(
+                context_frequencies=state.context_frequencies,
+                all_new_nouns=all_new_nouns,
+                new_masc_nouns=new_masc_nouns
+            )
 
-        # Filter for relevant contexts:
+        # Filter for relevant contexts, a context keeps the gender it was decided to have first:
         new_masc_contexts, new_fem_contexts = extract_relevant_contexts(updated_contexts=updated_contexts,
-                                                                        context_frequencies=context_frequencies)
-
-        # Now, go through all the words and if their context has been added to some gender, update their counts.
-        all_new_contexts |= new_masc_contexts | new_fem_contexts
-
-        updated_words = update_noun_frequencies_and_get_updated_words(
-            unannotated_corpus=unannotated_corpus,
-            all_new_contexts=all_new_contexts,
-            all_nouns=all_nouns,
-            noun_frequencies=noun_frequencies,
-            new_masc_contexts=new_masc_contexts
-        )
+                                                                        context_frequencies=state.context_frequencies,
+                                                                        fraction_to_allow=fraction_to_allow)
+        new_masc_contexts -= state.masc_contexts | state.fem_contexts
+        new_fem_contexts -= state.masc_contexts | state.fem_contexts
+
+        state.masc_contexts |= new_masc_contexts
+        state.fem_contexts |= new_fem_contexts
+
+        # Now, go through all the words and if their context has been added to some gender, update their counts. The
+        # contexts added in the previous iterations have already been counted.
+        all_new_contexts = new_masc_contexts | new_fem_contexts
+
+        if all_new_contexts:
+            updated_words |= backend.update_noun_frequencies_and_get_updated_words(
+                all_new_contexts=all_new_contexts,
+                all_nouns=all_nouns,
+                noun_frequencies=state.noun_frequencies,
+                new_masc_contexts=new_masc_contexts
+            )
 
         # from the set of updated words, remove those that were already decided
-        updated_words -= all_fem_nouns | all_masc_nouns
+        updated_words -= state.fem_nouns | state.masc_nouns
 
         new_masc_nouns, new_fem_nouns = extract_relevant_masc_fem_nouns(updated_words=updated_words,
-                                                                        noun_frequencies=noun_frequencies)
+                                                                        noun_frequencies=state.noun_frequencies,
+                                                                        fraction_to_allow=fraction_to_allow)
 
         # update lists of all fem/masc nouns
-        all_fem_nouns |= new_fem_nouns
-        all_masc_nouns |= new_masc_nouns
+        state.fem_nouns |= new_fem_nouns
+        state.masc_nouns |= new_masc_nouns
 
-        print(f"Newly added {len(new_masc_nouns)} nouns to MASC (total masc nouns = {len(all_masc_nouns)})")
+        print(f"Newly added {len(new_masc_nouns)} nouns to MASC (total masc nouns = {len(state.masc_nouns)})")
         print(new_masc_nouns)
-        print(f"Newly added {len(new_fem_nouns)} nouns to FEM  (total fem nouns = {len(all_fem_nouns)})")
+        print(f"Newly added {len(new_fem_nouns)} nouns to FEM  (total fem nouns = {len(state.fem_nouns)})")
         print(new_fem_nouns)
 
-    print(f"Total number of MASC nouns: {len(all_masc_nouns)} (cf. #masc seeds={len(masc_seeds)})")
-    print(f"Total number of FEM nouns: {len(all_fem_nouns)} (cf. #fem seeds={len(fem_seeds)})")
-    print(f"Nouns with unknown gender: {len(all_nouns - all_masc_nouns - all_fem_nouns)}")
-
-    return all_masc_nouns, all_fem_nouns, noun_frequencies
+        updated_contexts = set()
+        updated_words = set()
 
 
-def iterate_over_words_and_contexts(
-        corpus: Sequence[str],
-        context_types: Sequence[ContextType]) -> Iterator[tuple[str, Context]]:
+def update_state_with_new_tokens(state: BootstrappingState, all_nouns: set[str],
+                                 backend: CountingBackend) -> tuple[set[Context], set[str]]:
     """
-    For given corpus and set of context types, iterate over all pairs (word, context of the word).
-    """
-    for i in range(len(corpus)):
-        for context_type in context_types:
-            context = Context.get_from_corpus_index(context_type=context_type, corpus=corpus, index=i)
-            word = corpus[i]
-            if context is not None:
-                yield word, context
-
-
-def get_initial_gender_frequencies_of_contexts(
-        unannotated_corpus: Sequence[str],
-        allowed_context_types: Sequence[ContextType]) -> dict[Context, Frequency]:
-    """
-    For a given unannotated corpus and allowed types of contexts, extract all contexts present in the unannotated corpus
-    and initialize their counts.
-    :param allowed_context_types:
-    :param unannotated_corpus: Unannotated corpus for computing the absolute counts.
-    :return: Dictionary of frequencies.
+    Add the counts of the tokens appended to the corpus of the backend to the context frequencies of the state, and
+    the evidence of the already decided contexts to its noun frequencies (see `CountingBackend.extend`). Modifies the
+    given state. The plain counts of the new nouns are expected to be already added to the noun frequencies (see
+    `update_initial_gender_frequencies`).
+    :param state: The state corresponding to the corpus of the backend before it was extended.
+    :param all_nouns: Set of all strings from the language to be considered nouns.
+    :param backend: The backend the state was bootstrapped with, over the extended corpus.
+    :return: The contexts and the nouns whose counts have changed.
     """
-    all_contexts = [Context.get_from_corpus_index(context_type=context_type, corpus=unannotated_corpus, index=i) for
-                    context_type in allowed_context_types for i in range(len(unannotated_corpus))]
-
-    context_counts = Counter(all_contexts)
-
-    frequencies = dict()
-
-    for context in context_counts:
-        count = context_counts[context]
-        frequency = Frequency(quest=count, masc=0, fem=0)
-        frequencies[context] = frequency
-
-    return frequencies
+    return backend.extend(context_frequencies=state.context_frequencies, noun_frequencies=state.noun_frequencies,
+                          all_nouns=all_nouns, masc_nouns=state.masc_nouns, fem_nouns=state.fem_nouns,
+                          masc_contexts=state.masc_contexts, fem_contexts=state.fem_contexts)
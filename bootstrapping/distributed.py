@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import multiprocessing
+import traceback
+from collections import defaultdict
+from collections.abc import Mapping
+from multiprocessing.connection import Connection, Client, Listener, wait
+from pathlib import Path
+from typing import Iterator, Optional, Sequence, Hashable, MutableMapping, Iterable
+
+from config import COUNTING_BACKEND, FREQUENCY_TABLE_MEMORY_BUDGET_MB
+from bootstrapping.backends import CountingBackend, get_backend
+from bootstrapping.contexts import ContextType, Context
+from evidence_modeling.frequency import Frequency
+from raw_corpus.token_corpus import TokenCorpus
+from storage.frequency_table import create_frequency_table, prefetch
+
+# Methods of `ShardWorker` the coordinator may request, no other attribute of the worker is accessible to it.
+WORKER_COMMANDS = frozenset({"load", "load_token_corpus", "get_pairs", "count_contexts", "get_context_frequencies",
+                             "update_context_frequencies", "extend", "get_noun_deltas"})
+
+
+class ShardWorker:
+    """
+    Worker of the distributed bootstrapping. Owns one shard of the corpus, with the counting backend over it and the
+    counts of the contexts of the shard, and answers the requests of the coordinator by partial counts of its shard.
+    """
+    backend: Optional[CountingBackend]
+    all_nouns: Optional[set[str]]
+    context_frequencies: Optional[MutableMapping[Context, Frequency]]
+
+    def __init__(self) -> None:
+        self.backend = None
+        self.all_nouns = None
+        self.context_frequencies = None
+
+    def load(self, tokens: Sequence[str], start: int, stop: int, counting_backend: str,
+             context_types: Sequence[ContextType]) -> None:
+        """
+        Load the shard, given as tokens together with the neighbouring tokens of the shard.
+        """
+        self.backend = get_backend(counting_backend, corpus=tokens, context_types=context_types, start=start,
+                                   stop=stop)
+        self.context_frequencies = None
+
+    def load_token_corpus(self, directory: Path, start: int, stop: int, counting_backend: str,
+                          context_types: Sequence[ContextType]) -> None:
+        """
+        Load the shard from a token corpus, positions from `start` to `stop` of the corpus, accessible to the worker.
+        """
+        corpus = TokenCorpus(directory)
+        halo_start, halo_stop = max(start - 1, 0), min(stop + 1, len(corpus))
+        self.load(corpus[halo_start:halo_stop], start - halo_start, stop - halo_start, counting_backend,
+                  context_types)
+
+    def get_pairs(self) -> list[tuple[str, Context]]:
+        return list(self.backend.iterate_over_words_and_contexts())
+
+    def count_contexts(self, memory_budget_mb: Optional[float]) -> None:
+        """
+        Count the contexts of the shard. The counts stay with the worker, only the counts requested by the coordinator
+        are sent to it.
+        """
+        self.context_frequencies = self.backend.get_initial_gender_frequencies_of_contexts(
+            create_frequency_table(memory_budget_mb))
+
+    def get_context_frequencies(self, contexts: Optional[set[Context]]) -> dict[Context, Frequency]:
+        """
+        Get the counts of the given contexts in the shard (of all the contexts of the shard if None), the contexts not
+        occurring in the shard are left out.
+        """
+        if contexts is None:
+            return dict(self.context_frequencies.items())
+        prefetch(self.context_frequencies, contexts)
+        return {context: self.context_frequencies[context] for context in contexts
+                if context in self.context_frequencies}
+
+    def update_context_frequencies(self, all_new_nouns: set[str], new_masc_nouns: set[str]) -> set[Context]:
+        return self.backend.update_frequencies_and_get_updated_contexts(context_frequencies=self.context_frequencies,
+                                                                        all_new_nouns=all_new_nouns,
+                                                                        new_masc_nouns=new_masc_nouns)
+
+    def extend(self, tokens: list[str], all_nouns: Optional[set[str]], masc_nouns: set[str], fem_nouns: set[str],
+               masc_contexts: set[Context], fem_contexts: set[Context]) -> tuple[set[Context], dict[str, Frequency]]:
+        """
+        Append the given tokens to the shard, which has to be the last one, and count them.
+        :return: The updated contexts and the deltas of the noun frequencies.
+        """
+        if all_nouns is not None:
+            self.all_nouns = all_nouns
+        self.backend.corpus.extend(tokens)
+        deltas = defaultdict(lambda: Frequency(quest=0, masc=0, fem=0))
+        updated_contexts, _ = self.backend.extend(context_frequencies=self.context_frequencies,
+                                                  noun_frequencies=deltas, all_nouns=self.all_nouns,
+                                                  masc_nouns=masc_nouns, fem_nouns=fem_nouns,
+                                                  masc_contexts=masc_contexts, fem_contexts=fem_contexts)
+        return updated_contexts, dict(deltas)
+
+    def get_noun_deltas(self, all_new_contexts: set[Context], all_nouns: Optional[set[str]],
+                        new_masc_contexts: set[Context]) -> dict[str, Frequency]:
+        # The set of all nouns does not change between the iterations, so it is sent only once
+        if all_nouns is not None:
+            self.all_nouns = all_nouns
+        deltas = defaultdict(lambda: Frequency(quest=0, masc=0, fem=0))
+        self.backend.update_noun_frequencies_and_get_updated_words(all_new_contexts=all_new_contexts,
+                                                                   all_nouns=self.all_nouns,
+                                                                   noun_frequencies=deltas,
+                                                                   new_masc_contexts=new_masc_contexts)
+        return dict(deltas)
+
+
+def serve(connection: Connection) -> None:
+    """
+    Serve the requests of a coordinator on the given connection, until the coordinator closes it. A request is a pair
+    of the name of a method of `ShardWorker` (one of `WORKER_COMMANDS`) and its keyword arguments.
+    """
+    worker = ShardWorker()
+    while True:
+        try:
+            command, kwargs = connection.recv()
+        except EOFError:
+            return
+        if command == "close":
+            connection.close()
+            return
+        try:
+            if command not in WORKER_COMMANDS:
+                raise RuntimeError(f"Unknown request of the coordinator: {command!r}")
+            connection.send(("ok", getattr(worker, command)(**kwargs)))
+        except Exception:
+            connection.send(("error", traceback.format_exc()))
+
+
+def add_frequencies(frequencies: MutableMapping[Hashable, Frequency],
+                    partial_frequencies: Iterable[dict[Hashable, Frequency]]) -> set[Hashable]:
+    """
+    Reduce the partial frequencies (or their deltas) of the workers, by adding them to the given frequencies one by
+    one, as they are iterated over. Modifies the given frequencies.
+    :return: The set of keys of the partial frequencies.
+    """
+    keys = set()
+    for partial in partial_frequencies:
+        prefetch(frequencies, partial)
+        for key, delta in partial.items():
+            frequency = frequencies.setdefault(key, Frequency(quest=0, masc=0, fem=0))
+            frequency.quest += delta.quest
+            frequency.masc += delta.masc
+            frequency.fem += delta.fem
+            keys.add(key)
+    return keys
+
+
+class DistributedContextFrequencies(Mapping):
+    """
+    Frequencies of the contexts of the distributed bootstrapping. The counts are kept by the workers, each for the
+    contexts of its shard, so that no process holds the counts of all the contexts of the corpus. The coordinator
+    holds only the total counts of the contexts updated in the last iteration, which is what the thresholding needs,
+    and of the prefetched contexts. The total counts of other contexts are summed over the workers when accessed.
+
+    The frequencies are updated by the kernels of the distributed backend only. Iterating over the table gathers the
+    counts of all the contexts, e.g. to compare the table to another one.
+    """
+
+    def __init__(self, backend: "DistributedBackend") -> None:
+        self._backend = backend
+        self._totals = dict()
+
+    def _get_totals(self, contexts: Optional[set[Context]]) -> dict[Context, Frequency]:
+        totals = dict()
+        add_frequencies(totals, self._backend._broadcast("get_context_frequencies", contexts=contexts))
+        return totals
+
+    def fetch(self, contexts: set[Context]) -> None:
+        """
+        Replace the total counts held by the coordinator by the total counts of the given contexts.
+        """
+        self._totals = self._get_totals(contexts)
+
+    def prefetch(self, contexts: Iterable[Context]) -> None:
+        """
+        Fetch the total counts of the given contexts in one request to the workers, so that accessing them does not
+        request them one by one.
+        """
+        missing = {context for context in contexts if context not in self._totals}
+        if missing:
+            self._totals.update(self._get_totals(missing))
+
+    def __getitem__(self, context: Context) -> Frequency:
+        frequency = self._totals.get(context)
+        if frequency is None:
+            frequency = self._get_totals({context}).get(context)
+        if frequency is None:
+            raise KeyError(context)
+        return frequency
+
+    def __iter__(self) -> Iterator[Context]:
+        return iter(self._get_totals(None))
+
+    def __len__(self) -> int:
+        return len(self._get_totals(None))
+
+
+class DistributedBackend(CountingBackend):
+    """
+    Coordinator of the distributed bootstrapping. The corpus is split into contiguous shards, one per worker, each
+    worker holding its shard, the counting data of it and the counts of its contexts. The kernels broadcast the
+    frontier of new nouns or contexts to the workers, which compute in parallel, and reduce the partial counts returned
+    by them as they arrive. The workers hold the shards of a single distributed backend at a time, creating another one
+    over the same workers replaces them.
+    """
+    name = "distributed"
+    connections: Sequence[Connection]
+    memory_budget_mb: Optional[float]
+
+    def __init__(self, corpus: Sequence[str], context_types: Sequence[ContextType],
+                 connections: Sequence[Connection], counting_backend: str = COUNTING_BACKEND, start: int = 0,
+                 stop: Optional[int] = None,
+                 memory_budget_mb: Optional[float] = FREQUENCY_TABLE_MEMORY_BUDGET_MB) -> None:
+        """
+        :param corpus: The unannotated corpus. If it is a token corpus, the workers load their shards from its
+        directory themselves, which has to be accessible to them.
+        :param context_types: Types of the contexts to consider.
+        :param connections: Connections to the workers (see `start_local_workers` and `connect_to_workers`).
+        :param counting_backend: Name of the backend of the workers.
+        :param memory_budget_mb: Memory budget in MB of the table of the context frequencies of each worker, see
+        `create_frequency_table`.
+        """
+        super().__init__(corpus, context_types, start=start, stop=stop)
+        self.connections = connections
+        self.memory_budget_mb = memory_budget_mb
+        self._nouns_sent = None
+
+        requests = []
+        shards = len(connections)
+        for shard in range(shards):
+            shard_start = self.start + (self.stop - self.start) * shard // shards
+            shard_stop = self.start + (self.stop - self.start) * (shard + 1) // shards
+            if isinstance(corpus, TokenCorpus):
+                requests.append(("load_token_corpus", dict(directory=corpus.directory, start=shard_start,
+                                                           stop=shard_stop, counting_backend=counting_backend,
+                                                           context_types=context_types)))
+            else:
+                # The neighbouring tokens of the shard are needed for the contexts of its first and last token
+                halo_start, halo_stop = max(shard_start - 1, 0), min(shard_stop + 1, len(corpus))
+                requests.append(("load", dict(tokens=list(corpus[halo_start:halo_stop]),
+                                              start=shard_start - halo_start, stop=shard_stop - halo_start,
+                                              counting_backend=counting_backend, context_types=context_types)))
+        list(self._request(requests))
+
+    def _request(self, requests: Sequence[tuple[str, dict]], ordered: bool = False) -> Iterator:
+        """
+        Send one request to each worker, and iterate over the results as they arrive, so that they can be reduced one
+        by one instead of being held all at once. The workers compute in parallel. The results have to be iterated
+        over to the end, so that all the workers are ready for the next request.
+        :param ordered: Iterate over the results in the order of the workers, instead of the order of their arrival.
+        """
+        for connection, request in zip(self.connections, requests):
+            connection.send(request)
+
+        error = None
+        pending = list(self.connections)
+        while pending:
+            for connection in pending[:1] if ordered else wait(pending):
+                pending.remove(connection)
+                status, result = connection.recv()
+                if status != "ok":
+                    error = result if error is None else error
+                elif error is None:
+                    yield result
+        if error is not None:
+            raise RuntimeError(f"Bootstrapping worker failed:\n{error}")
+
+    def _broadcast(self, command: str, ordered: bool = False, **kwargs) -> Iterator:
+        return self._request([(command, kwargs)] * len(self.connections), ordered=ordered)
+
+    def _request_one(self, connection: Connection, command: str, **kwargs):
+        connection.send((command, kwargs))
+        status, result = connection.recv()
+        if status != "ok":
+            raise RuntimeError(f"Bootstrapping worker failed:\n{result}")
+        return result
+
+    def iterate_over_words_and_contexts(self) -> Iterator[tuple[str, Context]]:
+        for pairs in self._broadcast("get_pairs", ordered=True):
+            yield from pairs
+
+    def get_initial_gender_frequencies_of_contexts(
+            self,
+            frequencies: Optional[MutableMapping[Context, Frequency]] = None) -> MutableMapping[Context, Frequency]:
+        """
+        Count the contexts of the shards by the workers. The counts stay with the workers (see
+        `DistributedContextFrequencies`), the given table is not used, each worker creates its own table within the
+        memory budget of the backend.
+        """
+        list(self._broadcast("count_contexts", memory_budget_mb=self.memory_budget_mb))
+        return DistributedContextFrequencies(self)
+
+    def update_frequencies_and_get_updated_contexts(self, context_frequencies: MutableMapping[Context, Frequency],
+                                                    all_new_nouns: set[str], new_masc_nouns: set[str]) -> set[Context]:
+        """
+        Update the counts kept by the workers, and fetch the total counts of the updated contexts to the coordinator.
+        :param context_frequencies: The table returned by `get_initial_gender_frequencies_of_contexts`.
+        """
+        updated_contexts = set()
+        for contexts in self._broadcast("update_context_frequencies", all_new_nouns=all_new_nouns,
+                                        new_masc_nouns=new_masc_nouns):
+            updated_contexts |= contexts
+        context_frequencies.fetch(updated_contexts)
+        return updated_contexts
+
+    def extend(self, context_frequencies: MutableMapping[Context, Frequency],
+               noun_frequencies: MutableMapping[str, Frequency], all_nouns: set[str], masc_nouns: set[str],
+               fem_nouns: set[str], masc_contexts: set[Context], fem_contexts: set[Context]) -> \
+            tuple[set[Context], set[str]]:
+        """
+        Send the words appended to the corpus to the worker of the last shard, which counts them, and fetch the total
+        counts of the updated contexts to the coordinator.
+        :param context_frequencies: The table returned by `get_initial_gender_frequencies_of_contexts`.
+        """
+        tokens = list(self.corpus[self.stop:])
+        self.stop = len(self.corpus)
+        # Only the last worker gets the nouns, so they are not marked as sent
+        updated_contexts, deltas = self._request_one(
+            self.connections[-1], "extend", tokens=tokens,
+            all_nouns=None if all_nouns is self._nouns_sent else all_nouns, masc_nouns=masc_nouns,
+            fem_nouns=fem_nouns, masc_contexts=masc_contexts, fem_contexts=fem_contexts)
+        context_frequencies.fetch(updated_contexts)
+        return updated_contexts, add_frequencies(noun_frequencies, [deltas])
+
+    def update_noun_frequencies_and_get_updated_words(self, all_new_contexts: set[Context], all_nouns: set[str],
+                                                      noun_frequencies: MutableMapping[str, Frequency],
+                                                      new_masc_contexts: set[Context]) -> set[str]:
+        nouns_to_send = None if all_nouns is self._nouns_sent else all_nouns
+        self._nouns_sent = all_nouns
+        return add_frequencies(noun_frequencies, self._broadcast("get_noun_deltas", all_new_contexts=all_new_contexts,
+                                                                 all_nouns=nouns_to_send,
+                                                                 new_masc_contexts=new_masc_contexts))
+
+
+def start_local_workers(count: int) -> list[Connection]:
+    """
+    Start the given number of workers as local processes.
+    :return: Connections to the workers.
+    """
+    connections = []
+    for _ in range(count):
+        connection, worker_connection = multiprocessing.Pipe()
+        multiprocessing.Process(target=serve, args=(worker_connection,), daemon=True).start()
+        worker_connection.close()
+        connections.append(connection)
+    return connections
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """
+    Parse the address of a worker given as `host:port`.
+    """
+    host, separator, port = address.rpartition(":")
+    if not separator or not host or not port.isdigit():
+        raise RuntimeError(f"Invalid address of a bootstrapping worker: {address}, expected host:port")
+    return host, int(port)
+
+
+def connect_to_workers(addresses: Sequence[tuple[str, int]], authkey: bytes) -> list[Connection]:
+    """
+    Connect to workers running `run_worker_server`, e.g. on other nodes.
+    :return: Connections to the workers.
+    """
+    return [Client(address, authkey=authkey) for address in addresses]
+
+
+def close_workers(connections: Sequence[Connection]) -> None:
+    for connection in connections:
+        connection.send(("close", dict()))
+        connection.close()
+
+
+@contextlib.contextmanager
+def local_workers(count: int) -> Iterator[list[Connection]]:
+    """
+    Context manager starting local workers, and stopping them at the end.
+    """
+    connections = start_local_workers(count)
+    try:
+        yield connections
+    finally:
+        close_workers(connections)
+
+
+@contextlib.contextmanager
+def remote_workers(addresses: Sequence[tuple[str, int]], authkey: bytes) -> Iterator[list[Connection]]:
+    """
+    Context manager connecting to workers running `run_worker_server`, and disconnecting from them at the end. The
+    workers keep running, waiting for another coordinator.
+    """
+    connections = connect_to_workers(addresses, authkey)
+    try:
+        yield connections
+    finally:
+        close_workers(connections)
+
+
+def run_worker_server(host: str, port: int, authkey: bytes) -> None:
+    """
+    Run a worker accepting coordinators on the given address, one coordinator at a time.
+    """
+    with Listener((host, port), authkey=authkey) as listener:
+        print(f"Bootstrapping worker listening on {host}:{port}")
+        while True:
+            with listener.accept() as connection:
+                serve(connection)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a worker of the distributed bootstrapping.")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=6100, help="Port to listen on.")
+    parser.add_argument("--authkey", required=True, help="Shared secret of the coordinator and the workers.")
+    args = parser.parse_args()
+
+    run_worker_server(args.host, args.port, args.authkey.encode("utf-8"))
+
+
+if __name__ == "__main__":
+    main()
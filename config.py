@@ -6,3 +6,23 @@ DATA_DIR = PROJECT_DIR / 'data'
 
 EN_MASC_SEEDS_FILEPATH = DATA_DIR / 'masc.txt'
 EN_FEM_SEEDS_FILEPATH = DATA_DIR / 'fem.txt'
+
+CACHE_DIR = PROJECT_DIR / 'cache'
+
+# Artifacts of the stages of main.py, each stage reads the artifacts of the previous ones
+ARTIFACTS_DIR = PROJECT_DIR / 'artifacts'
+UD_DATASET_FILEPATH = ARTIFACTS_DIR / 'ud.pickle'
+SEEDS_FILEPATH = ARTIFACTS_DIR / 'seeds.json'
+NOUNS_FILEPATH = ARTIFACTS_DIR / 'nouns.txt'
+INDEX_DIR = ARTIFACTS_DIR / 'index'
+MODEL_FILEPATH = ARTIFACTS_DIR / 'model.pickle'
+# The genders predicted by the model, to be looked up without loading the model
+GENDERS_FILEPATH = ARTIFACTS_DIR / 'genders.tsv'
+
+# Counting backend of the context bootstrapping: "python" (reference), "numpy" or "numba"
+COUNTING_BACKEND = 'python'
+
+# Memory budget in MB of each of the context and noun frequency tables of the bootstrapping, the entries exceeding it
+# spill to the disk (see `storage.frequency_table`). None keeps the tables in memory without a budget.
+FREQUENCY_TABLE_MEMORY_BUDGET_MB = None
+SPILL_DIR = CACHE_DIR / 'spill'
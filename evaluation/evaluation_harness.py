@@ -0,0 +1,243 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence
+
+from config import CACHE_DIR
+from bootstrapping.bootstrapping import ALLOWED_CONTEXT_MODELS
+from bootstrapping.contexts import SUFFIX_LENGTH
+from evidence_modeling.gender_predictor import GenderPredictor
+from gender import Gender
+from ud_dataset.ud_dataset import UDDataset, EvaluationMetric
+
+# Increase whenever the bootstrapping algorithm changes, so that stale cached predictors are not reused.
+BOOTSTRAPPING_CACHE_VERSION = 2
+
+
+@dataclass(frozen=True)
+class BootstrappingInputs:
+    """
+    Everything the bootstrapped predictor depends on, apart from the configuration of the bootstrapping itself.
+    """
+    masc_seeds: frozenset[str]
+    fem_seeds: frozenset[str]
+    nouns: frozenset[str]
+    unannotated_corpus: tuple[str, ...]
+
+    def get_cache_key(self) -> str:
+        """
+        Compute a content hash of the inputs and of the bootstrapping configuration.
+        :return: Hexadecimal digest identifying the bootstrapped predictor.
+        """
+        digest = hashlib.sha256()
+        configuration = [str(BOOTSTRAPPING_CACHE_VERSION), str(SUFFIX_LENGTH)]
+        configuration += [context_type.name for context_type in ALLOWED_CONTEXT_MODELS]
+        for part in [configuration, sorted(self.masc_seeds), sorted(self.fem_seeds), sorted(self.nouns),
+                     self.unannotated_corpus]:
+            digest.update("\0".join(part).encode("utf-8"))
+            digest.update(b"\1")
+        return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class EvaluationTask:
+    """
+    Evaluation of either a bootstrapped predictor (given by its inputs, or saved in a file), or of a baseline predicting
+    always the same gender, on a gold dataset.
+    """
+    name: str
+    gold_dataset: UDDataset.Dataset
+    inputs: Optional[BootstrappingInputs] = None
+    baseline_gender: Optional[Gender] = None
+    predictor_path: Optional[Path] = None
+
+
+@dataclass
+class EvaluationResult:
+    name: str
+    metric: EvaluationMetric
+    bootstrapping_seconds: float
+    evaluation_seconds: float
+    # None for baselines and saved predictors, which need no bootstrapping
+    cached: Optional[bool]
+
+
+def get_cache_path(cache_key: str, cache_dir: Path = CACHE_DIR) -> Path:
+    return cache_dir / f"predictor-{cache_key}.pickle"
+
+
+def bootstrap_to_cache(inputs: BootstrappingInputs, cache_dir: Path = CACHE_DIR) -> float:
+    """
+    Bootstrap a predictor from the given inputs and save it to the cache.
+    :param inputs: Inputs of the bootstrapping.
+    :param cache_dir: Directory of the cache.
+    :return: Time spent by bootstrapping, in seconds.
+    """
+    start = time.perf_counter()
+    gender_predictor = GenderPredictor(masc_seeds=set(inputs.masc_seeds), fem_seeds=set(inputs.fem_seeds),
+                                       nouns=set(inputs.nouns), unannotated_corpus=inputs.unannotated_corpus)
+    gender_predictor.bootstrap_from_context()
+    seconds = time.perf_counter() - start
+
+    # Write to a temporary file first, so that an interrupted run does not leave a corrupted cache entry.
+    path = get_cache_path(inputs.get_cache_key(), cache_dir)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    gender_predictor.save(tmp_path)
+    os.replace(tmp_path, path)
+    return seconds
+
+
+def evaluate_task(gold_dataset: UDDataset.Dataset, baseline_gender: Optional[Gender],
+                  predictor_path: Optional[Path]) -> tuple[EvaluationMetric, float]:
+    """
+    Evaluate a single task, either of a baseline, or of a saved predictor.
+    :param gold_dataset: The gold dataset of the task.
+    :param baseline_gender: Gender predicted always by a baseline, None for the other tasks.
+    :param predictor_path: File of the predictor of the task (saved or cached), None for the baselines.
+    :return: The evaluation metric and the time spent by the evaluation, in seconds.
+    """
+    start = time.perf_counter()
+    if baseline_gender is not None:
+        predictions = [baseline_gender] * len(gold_dataset)
+    else:
+        gender_predictor = GenderPredictor.load(predictor_path)
+        predictions = gender_predictor.predict_gender_for_corpus(gold_dataset.text)
+    metric = UDDataset.evaluate(gold_dataset, predictions)
+    return metric, time.perf_counter() - start
+
+
+def run_evaluations(tasks: Sequence[EvaluationTask], cache_dir: Path = CACHE_DIR,
+                    max_workers: Optional[int] = None) -> list[EvaluationResult]:
+    """
+    Run the given evaluation tasks in parallel. Each distinct set of bootstrapping inputs is bootstrapped only once,
+    and only if the corresponding predictor is not cached yet.
+    :param tasks: Tasks to evaluate.
+    :param cache_dir: Directory of the cache of bootstrapped predictors.
+    :param max_workers: Number of worker processes, defaults to the number of CPUs.
+    :return: Results of the tasks, in the order of the tasks.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    cache_keys = [task.inputs.get_cache_key() if task.inputs is not None else None for task in tasks]
+
+    to_bootstrap = dict()
+    for task, cache_key in zip(tasks, cache_keys):
+        if cache_key is not None and not get_cache_path(cache_key, cache_dir).exists():
+            to_bootstrap[cache_key] = task.inputs
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        bootstrapping_futures = {cache_key: executor.submit(bootstrap_to_cache, inputs, cache_dir)
+                                 for cache_key, inputs in to_bootstrap.items()}
+        bootstrapping_seconds = {cache_key: future.result() for cache_key, future in bootstrapping_futures.items()}
+
+        # Only the parts of a task needed by the evaluation are sent to the workers, not the unannotated corpus
+        evaluation_futures = []
+        for task, cache_key in zip(tasks, cache_keys):
+            predictor_path = get_cache_path(cache_key, cache_dir) if cache_key is not None else task.predictor_path
+            evaluation_futures.append(executor.submit(evaluate_task, task.gold_dataset, task.baseline_gender,
+                                                      predictor_path))
+
+        results = []
+        for task, cache_key, future in zip(tasks, cache_keys, evaluation_futures):
+            metric, evaluation_seconds = future.result()
+            # The bootstrapping is reported on the first task of its inputs only, the others reuse its predictor
+            cached = None if cache_key is None else cache_key not in bootstrapping_seconds
+            results.append(EvaluationResult(name=task.name, metric=metric,
+                                            bootstrapping_seconds=bootstrapping_seconds.pop(cache_key, 0.0),
+                                            evaluation_seconds=evaluation_seconds, cached=cached))
+    return results
+
+
+def get_baseline_tasks(name: str, gold_dataset: UDDataset.Dataset) -> list[EvaluationTask]:
+    """
+    Get the tasks evaluating the baselines predicting always feminine and always masculine gender.
+    """
+    return [EvaluationTask(name=f"{name} (predict all fem)", gold_dataset=gold_dataset,
+                           baseline_gender=Gender.FEMININE),
+            EvaluationTask(name=f"{name} (predict all masc)", gold_dataset=gold_dataset,
+                           baseline_gender=Gender.MASCULINE)]
+
+
+def get_split_tasks(ud: UDDataset, masc_seeds: set[str], fem_seeds: set[str], nouns: set[str],
+                    splits: Sequence[str] = ("dev", "test"), baselines: bool = True) -> list[EvaluationTask]:
+    """
+    Get the tasks evaluating a predictor bootstrapped on the training data on the given splits of the UD dataset.
+    :param ud: The UD dataset.
+    :param masc_seeds: Set of masculine noun seeds.
+    :param fem_seeds: Set of feminine noun seeds.
+    :param nouns: Set of all nouns of the language.
+    :param splits: Names of the splits to evaluate on.
+    :param baselines: Whether to evaluate also the baselines on each split.
+    :return: List of tasks.
+    """
+    inputs = BootstrappingInputs(masc_seeds=frozenset(masc_seeds), fem_seeds=frozenset(fem_seeds),
+                                 nouns=frozenset(nouns), unannotated_corpus=tuple(ud.train.text))
+    tasks = []
+    for split in splits:
+        gold_dataset = getattr(ud, split)
+        tasks.append(EvaluationTask(name=split, gold_dataset=gold_dataset, inputs=inputs))
+        if baselines:
+            tasks += get_baseline_tasks(split, gold_dataset)
+    return tasks
+
+
+def get_saved_predictor_tasks(ud: UDDataset, predictor_path: Path, splits: Sequence[str] = ("dev", "test"),
+                              baselines: bool = True) -> list[EvaluationTask]:
+    """
+    Get the tasks evaluating a saved predictor (see `GenderPredictor.save`) on the given splits of the UD dataset.
+    :param ud: The UD dataset.
+    :param predictor_path: File of the saved predictor.
+    :param splits: Names of the splits to evaluate on.
+    :param baselines: Whether to evaluate also the baselines on each split.
+    :return: List of tasks.
+    """
+    tasks = []
+    for split in splits:
+        gold_dataset = getattr(ud, split)
+        tasks.append(EvaluationTask(name=split, gold_dataset=gold_dataset, predictor_path=predictor_path))
+        if baselines:
+            tasks += get_baseline_tasks(split, gold_dataset)
+    return tasks
+
+
+def get_cross_validation_tasks(dataset: UDDataset.Dataset, masc_seeds: set[str], fem_seeds: set[str],
+                               nouns: set[str], folds: int, baselines: bool = False) -> list[EvaluationTask]:
+    """
+    Get the tasks of cross-validation over folds of the given dataset: for each fold, a predictor bootstrapped on the
+    rest of the dataset is evaluated on the fold. The rest of the dataset is concatenated into a single corpus.
+    :param dataset: The dataset to split into folds.
+    :param masc_seeds: Set of masculine noun seeds.
+    :param fem_seeds: Set of feminine noun seeds.
+    :param nouns: Set of all nouns of the language.
+    :param folds: Number of folds.
+    :param baselines: Whether to evaluate also the baselines on each fold.
+    :return: List of tasks.
+    """
+    tasks = []
+    for fold in range(folds):
+        unannotated_corpus, held_out = dataset.get_fold(fold, folds)
+        inputs = BootstrappingInputs(masc_seeds=frozenset(masc_seeds), fem_seeds=frozenset(fem_seeds),
+                                     nouns=frozenset(nouns), unannotated_corpus=tuple(unannotated_corpus))
+        name = f"fold {fold + 1}/{folds}"
+        tasks.append(EvaluationTask(name=name, gold_dataset=held_out, inputs=inputs))
+        if baselines:
+            tasks += get_baseline_tasks(name, held_out)
+    return tasks
+
+
+def print_results(results: Sequence[EvaluationResult]) -> None:
+    """
+    Print the results of the evaluation, with the timing.
+    """
+    for result in results:
+        if result.cached is None:
+            bootstrapping = "no bootstrapping"
+        elif result.cached:
+            bootstrapping = "bootstrapping cached"
+        else:
+            bootstrapping = f"bootstrapping {result.bootstrapping_seconds:.1f} s"
+        print(f"{result.name}: precision={result.metric.precision:.6f}, recall={result.metric.recall:.6f} "
+              f"({bootstrapping}, evaluation {result.evaluation_seconds:.1f} s)")
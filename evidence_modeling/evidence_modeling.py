@@ -1,6 +1,7 @@
-from typing import Sequence
+from typing import Sequence, MutableMapping
 
 from evidence_modeling.frequency import Frequency
+from storage.frequency_table import prefetch
 from collections import Counter
 
 
@@ -28,3 +29,31 @@ def get_initial_gender_frequencies(noun_set: set[str], unannotated_corpus: Seque
         frequencies[noun] = frequency
 
     return frequencies
+
+
+def update_initial_gender_frequencies(frequencies: MutableMapping[str, Frequency], new_tokens: Sequence[str],
+                                      noun_set: set[str], masc_seeds: set[str], fem_seeds: set[str]) -> set[str]:
+    """
+    Add the counts of tokens appended to the unannotated corpus to the frequencies, in the same way as
+    `get_initial_gender_frequencies` counts them. Modifies the given frequencies.
+    :param frequencies: Frequencies of all nouns of the language, possibly a table spilling to the disk.
+    :param new_tokens: Tokens appended to the unannotated corpus.
+    :param noun_set: Set of all nouns of the language, held in memory, so that the tokens are not looked up in the
+    frequencies one by one.
+    :param masc_seeds: Set of masculine noun seeds.
+    :param fem_seeds: Set of feminine noun seeds.
+    :return: The set of nouns whose counts have changed.
+    """
+    counts = Counter(token for token in new_tokens if token in noun_set)
+    prefetch(frequencies, counts)
+
+    for noun, count in counts.items():
+        frequency = frequencies[noun]
+        if noun in masc_seeds:
+            frequency.masc += count
+        elif noun in fem_seeds:
+            frequency.fem += count
+        else:
+            frequency.quest += count
+
+    return set(counts)
@@ -1,21 +1,47 @@
 from gender import Gender
 from evidence_modeling.frequency import Frequency
-from evidence_modeling.evidence_modeling import get_initial_gender_frequencies
-from typing import Optional, Sequence
-from bootstrapping.bootstrapping import update_frequencies_by_bootstrapping
+from evidence_modeling.evidence_modeling import get_initial_gender_frequencies, update_initial_gender_frequencies
+from typing import Optional, Sequence, MutableMapping, TYPE_CHECKING
+from pathlib import Path
+import pickle
+from config import COUNTING_BACKEND, FREQUENCY_TABLE_MEMORY_BUDGET_MB
+
+# The bootstrapping is imported only by the methods using it, so that a saved predictor can be loaded for prediction
+# without importing it.
+if TYPE_CHECKING:
+    from multiprocessing.connection import Connection
+    from bootstrapping.bootstrapping import BootstrappingState
+    from bootstrapping.backends import CountingBackend
 
 
 class GenderPredictor:
+    masc_seeds: set[str]
+    fem_seeds: set[str]
     known_masculines: set[str]
     known_feminines: set[str]
-    frequencies: dict[str, Frequency]
+    frequencies: MutableMapping[str, Frequency]
     unannotated_corpus: Sequence[str]
+    bootstrapping_state: Optional["BootstrappingState"]
+    counting_backend: str
+    memory_budget_mb: Optional[float]
+    backend: Optional["CountingBackend"]
 
-    def __init__(self, masc_seeds: set[str], fem_seeds: set[str], nouns: set[str], unannotated_corpus: Sequence[str]):
+    def __init__(self, masc_seeds: set[str], fem_seeds: set[str], nouns: set[str], unannotated_corpus: Sequence[str],
+                 counting_backend: str = COUNTING_BACKEND,
+                 memory_budget_mb: Optional[float] = FREQUENCY_TABLE_MEMORY_BUDGET_MB):
+        self.masc_seeds = masc_seeds
+        self.fem_seeds = fem_seeds
         self.known_masculines = masc_seeds
         self.known_feminines = fem_seeds
         self.all_nouns = nouns
         self.unannotated_corpus = unannotated_corpus
+        self.bootstrapping_state = None
+        self.counting_backend = counting_backend
+        self.memory_budget_mb = memory_budget_mb
+        # The counting backend of the bootstrapping, kept to count the tokens the corpus is extended by
+        self.backend = None
+        # The given corpus is copied only when it is extended for the first time, unless it is a token corpus
+        self._owns_corpus = False
         self.frequencies = get_initial_gender_frequencies(noun_set=nouns, unannotated_corpus=unannotated_corpus,
                                                           masc_seeds=masc_seeds, fem_seeds=fem_seeds)
 
@@ -52,14 +78,117 @@ class GenderPredictor:
         """
         return [self.predict_gender(word) for word in corpus]
 
-    def bootstrap_from_context(self) -> None:
+    def bootstrap_from_context(self, workers: Optional[Sequence["Connection"]] = None) -> None:
         """
         Using an unannotated corpus, extend the set of known masculines/feminines of the predictor, with the method
         of context bootstrapping.
+        :param workers: Connections to workers of the distributed bootstrapping (see `bootstrapping.distributed`),
+        to split the counting over the corpus among them. By default, everything is counted in this process.
         """
-        self.known_masculines, self.known_feminines, self.frequencies = update_frequencies_by_bootstrapping(
+        from bootstrapping.bootstrapping import ALLOWED_CONTEXT_MODELS, bootstrap_with_backend
+        from bootstrapping.backends import get_backend
+        from bootstrapping.distributed import DistributedBackend
+
+        if workers is None:
+            backend = get_backend(self.counting_backend, corpus=self.unannotated_corpus,
+                                  context_types=ALLOWED_CONTEXT_MODELS)
+        else:
+            backend = DistributedBackend(self.unannotated_corpus, context_types=ALLOWED_CONTEXT_MODELS,
+                                         connections=workers, counting_backend=self.counting_backend,
+                                         memory_budget_mb=self.memory_budget_mb)
+        self.bootstrapping_state = bootstrap_with_backend(
             masc_seeds=self.known_masculines,
             fem_seeds=self.known_feminines,
             all_nouns=self.all_nouns,
-            unannotated_corpus=self.unannotated_corpus,
-            original_frequencies=self.frequencies)
+            backend=backend,
+            original_frequencies=self.frequencies,
+            memory_budget_mb=self.memory_budget_mb)
+        self.backend = backend
+        self.known_masculines = self.bootstrapping_state.masc_nouns
+        self.known_feminines = self.bootstrapping_state.fem_nouns
+        self.frequencies = self.bootstrapping_state.noun_frequencies
+
+    def update_with_corpus(self, new_tokens: Sequence[str]) -> None:
+        """
+        Extend the unannotated corpus by new tokens. If the predictor has already been bootstrapped, the counting
+        backend of the bootstrapping (or its workers, which have to be still running) counts the new tokens, and the
+        bootstrapping is resumed from the contexts and nouns whose counts have changed.
+        :param new_tokens: Tokens to be appended to the unannotated corpus.
+        """
+        from bootstrapping.bootstrapping import INITIAL_FRACTION_TO_ALLOW, run_bootstrapping, \
+            update_state_with_new_tokens
+        from raw_corpus.token_corpus import TokenCorpus
+
+        if not self._owns_corpus and not isinstance(self.unannotated_corpus, TokenCorpus):
+            self.unannotated_corpus = list(self.unannotated_corpus)
+            self._owns_corpus = True
+            if self.backend is not None:
+                # The copy has the same tokens, so the encoding of the corpus by the backend stays valid
+                self.backend.corpus = self.unannotated_corpus
+        start = len(self.unannotated_corpus)
+        self.unannotated_corpus.extend(new_tokens)
+
+        updated_words = update_initial_gender_frequencies(frequencies=self.frequencies,
+                                                          new_tokens=self.unannotated_corpus[start:],
+                                                          noun_set=self.all_nouns,
+                                                          masc_seeds=self.masc_seeds, fem_seeds=self.fem_seeds)
+        if self.bootstrapping_state is None:
+            return
+
+        updated_contexts, updated_context_words = update_state_with_new_tokens(state=self.bootstrapping_state,
+                                                                               all_nouns=self.all_nouns,
+                                                                               backend=self.backend)
+        # The resumed iterations keep the initial threshold: the bootstrapping has stopped because nothing passed even
+        # the relaxed ones, and relaxing them on every update tends to label almost all nouns with one gender. Earlier
+        # decisions are never revisited, so after adding a substantial part of the corpus, bootstrap it from scratch.
+        run_bootstrapping(state=self.bootstrapping_state, all_nouns=self.all_nouns, backend=self.backend,
+                          new_masc_nouns=set(), new_fem_nouns=set(),
+                          updated_contexts=updated_contexts, updated_words=updated_words | updated_context_words,
+                          fraction_to_allow=INITIAL_FRACTION_TO_ALLOW)
+
+    def save(self, path: Path) -> None:
+        """
+        Save the gender sets and frequencies of the predictor, which is everything needed for prediction.
+        :param path: File to save the predictor to.
+        """
+        with open(path, "wb") as f:
+            pickle.dump({"known_masculines": self.known_masculines,
+                         "known_feminines": self.known_feminines,
+                         "frequencies": dict(self.frequencies.items())}, f)
+
+    def save_genders(self, path: Path) -> None:
+        """
+        Save the predicted gender of every noun with a predicted gender, one noun per line followed by a tab and the
+        gender, so that the predictions can be looked up without loading the predictor.
+        :param path: File to save the genders to.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for noun in sorted(self.frequencies):
+                gender = self.predict_gender(noun)
+                if gender is not None:
+                    f.write(f"{noun}\t{gender.value}\n")
+
+    @staticmethod
+    def load(path: Path) -> "GenderPredictor":
+        """
+        Load a predictor saved by `save`. The loaded predictor can predict, but it does not hold the unannotated
+        corpus, so it cannot be bootstrapped any further.
+        :param path: File to load the predictor from.
+        :return: The loaded predictor.
+        """
+        with open(path, "rb") as f:
+            saved = pickle.load(f)
+        predictor = GenderPredictor.__new__(GenderPredictor)
+        predictor.bootstrapping_state = None
+        predictor.backend = None
+        predictor.counting_backend = COUNTING_BACKEND
+        predictor.memory_budget_mb = FREQUENCY_TABLE_MEMORY_BUDGET_MB
+        predictor.known_masculines = saved["known_masculines"]
+        predictor.known_feminines = saved["known_feminines"]
+        predictor.frequencies = saved["frequencies"]
+        predictor.masc_seeds = predictor.known_masculines
+        predictor.fem_seeds = predictor.known_feminines
+        predictor.all_nouns = set(predictor.frequencies)
+        predictor.unannotated_corpus = []
+        predictor._owns_corpus = True
+        return predictor
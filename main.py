@@ -1,48 +1,374 @@
-import sys
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
 import os
+import sys
+from collections.abc import Callable
+from pathlib import Path
 
-from seeding.obtain_seeds import obtain_seeds
-from config import EN_MASC_SEEDS_FILEPATH, EN_FEM_SEEDS_FILEPATH
+from config import EN_MASC_SEEDS_FILEPATH, EN_FEM_SEEDS_FILEPATH, ARTIFACTS_DIR, UD_DATASET_FILEPATH, SEEDS_FILEPATH, \
+    NOUNS_FILEPATH, INDEX_DIR, MODEL_FILEPATH, GENDERS_FILEPATH, COUNTING_BACKEND, FREQUENCY_TABLE_MEMORY_BUDGET_MB
 
-from ud_dataset.ud_dataset import UDDataset
-from gender import Gender
-from evidence_modeling.gender_predictor import GenderPredictor
+# The stages import the modules they need only when they run, so that e.g. the prediction by the saved genders does
+# not import the UD parsing, the translation, the bootstrapping or even the predictor. Annotations are not evaluated,
+# so that argparse is not imported for them either.
 
 
-def main() -> None:
-    # Translation of English seed nouns, removing collisions, no manual check
-    masc_seeds, fem_seeds = obtain_seeds(EN_MASC_SEEDS_FILEPATH, EN_FEM_SEEDS_FILEPATH)
+# Each artifact is written together with the record of its inputs (the artifacts of the previous stages or the input
+# files) and of their modification times, one input per line, so that an artifact built from inputs changed since is
+# out of date. The options of the stage affecting the artifact are recorded as well, one per line after OPTION_PREFIX.
+INPUTS_SUFFIX = ".inputs"
+OPTION_PREFIX = "option"
+
+# The reason of an artifact being out of date if its stage has been interrupted before recording its inputs
+NOT_RECORDED = "its inputs are not recorded"
+
+
+def get_inputs_path(path: Path) -> Path:
+    return path.with_name(path.name + INPUTS_SUFFIX)
+
+
+def record_inputs(path: Path, inputs: list[Path], options: dict[str, object] | None = None) -> None:
+    """
+    Record the inputs an artifact has been built from, with their current modification times, and the options of the
+    stage it has been built with.
+    """
+    inputs_path = get_inputs_path(path)
+    tmp_path = inputs_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(f"{os.stat(input_path).st_mtime_ns}\t{os.path.abspath(input_path)}\n" for input_path in inputs)
+        f.writelines(f"{OPTION_PREFIX}\t{name}={value}\n" for name, value in (options or dict()).items())
+    os.replace(tmp_path, inputs_path)
+
+
+def get_outdated_reason(path: Path, inputs: list[Path] | None = None,
+                        options: dict[str, object] | None = None) -> str | None:
+    """
+    Find out why an artifact is out of date: it does not exist, it has been built from other inputs or with other
+    options, one of its inputs has changed since it was built, or an input is an artifact out of date itself.
+    :param path: The artifact.
+    :param inputs: The inputs the artifact would be built from now, the recorded ones by default.
+    :param options: The options the artifact would be built with now, the recorded ones by default.
+    :return: The reason, None if the artifact is up to date.
+    """
+    if not path.exists():
+        return "it does not exist"
+    inputs_path = get_inputs_path(path)
+    if not inputs_path.exists():
+        return NOT_RECORDED
+    recorded = dict()
+    recorded_options = dict()
+    with open(inputs_path, "r", encoding="utf-8") as f:
+        for line in f:
+            mtime, input_path = line.rstrip("\n").split("\t", 1)
+            if mtime == OPTION_PREFIX:
+                name, value = input_path.split("=", 1)
+                recorded_options[name] = value
+            else:
+                recorded[input_path] = int(mtime)
+
+    if inputs is not None and set(recorded) != {os.path.abspath(input_path) for input_path in inputs}:
+        return "it was built from other inputs"
+    if options is not None and recorded_options != {name: str(value) for name, value in options.items()}:
+        return "it was built with other options"
+    for input_path, mtime in recorded.items():
+        if not os.path.exists(input_path) or os.stat(input_path).st_mtime_ns != mtime:
+            return f"{input_path} has changed since it was built"
+        if get_inputs_path(Path(input_path)).exists() and get_outdated_reason(Path(input_path)) is not None:
+            return f"{input_path} is out of date"
+    return None
+
+
+def is_up_to_date(paths: list[Path], inputs: list[Path], args: argparse.Namespace,
+                  options: dict[str, object] | None = None) -> bool:
+    """
+    Check whether the artifacts of a stage are already built from its current inputs and options, and they should not
+    be rebuilt. Otherwise, the records of their inputs are removed, so that they stay out of date if the rebuilding is
+    interrupted.
+    """
+    reasons = [get_outdated_reason(path, inputs, options or dict()) for path in paths]
+    if not args.force and not any(reasons):
+        for path in paths:
+            print(f"{path} is already built, use --force to rebuild it")
+        return True
+
+    for path, reason in zip(paths, reasons):
+        if reason is not None and path.exists():
+            print(f"{path} is out of date ({reason}), rebuilding it")
+        if get_inputs_path(path).exists():
+            os.remove(get_inputs_path(path))
+    return False
+
+
+def require(path: Path, stage: str) -> Path:
+    """
+    Check that the artifact of a previous stage is built, and it is not out of date.
+    """
+    if not path.exists():
+        raise RuntimeError(f"{path} does not exist, run `python main.py {stage}` first")
+    reason = get_outdated_reason(path)
+    if reason is not None:
+        raise RuntimeError(f"{path} is out of date ({reason}), run `python main.py {stage}` to rebuild it")
+    return path
+
+
+def write_artifact(path: Path, write: Callable[[Path], object], inputs: list[Path],
+                   options: dict[str, object] | None = None) -> None:
+    """
+    Write an artifact to a temporary file first, so that an interrupted stage does not leave a corrupted artifact, and
+    record the inputs and options it has been built with.
+    """
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+    record_inputs(path, inputs, options)
+
+
+def load_ud_dataset():
+    import pickle
+    # Unpickling the dataset imports the UD dataset module
+    with open(require(UD_DATASET_FILEPATH, "fetch"), "rb") as f:
+        return pickle.load(f)
+
+
+def load_seeds() -> tuple[set[str], set[str]]:
+    import json
+    with open(require(SEEDS_FILEPATH, "seeds"), "r", encoding="utf-8") as f:
+        seeds = json.load(f)
+    return set(seeds["masc"]), set(seeds["fem"])
+
+
+def load_nouns() -> set[str]:
+    with open(require(NOUNS_FILEPATH, "index"), "r", encoding="utf-8") as f:
+        return set(f.read().splitlines())
+
+
+def fetch(args: argparse.Namespace) -> None:
+    """
+    Download the UD datasets and parse them.
+    """
+    options = {"max_tokens": args.max_tokens}
+    if is_up_to_date([UD_DATASET_FILEPATH], [], args, options):
+        return
+    import pickle
+    from ud_dataset.ud_dataset import UDDataset
+
+    ud = UDDataset(max_tokens=args.max_tokens)
 
-    # Initialization of UD datasets, downloads the data if necessary and processes them
-    ud = UDDataset()
+    def write(path: Path) -> None:
+        with open(path, "wb") as f:
+            pickle.dump(ud, f)
 
-    # print(ud.evaluate(ud.test, [Gender.MASCULINE] * len(ud.test)))
+    write_artifact(UD_DATASET_FILEPATH, write, inputs=[], options=options)
+    print(f"Saved {len(ud.train)} train, {len(ud.dev)} dev and {len(ud.test)} test tokens to {UD_DATASET_FILEPATH}")
 
-    # The set of all forms of all Czech nouns  (for simplification and faster computation, we use only the noun forms
+
+def seeds(args: argparse.Namespace) -> None:
+    """
+    Translate the English seed nouns, removing collisions, no manual check.
+    """
+    inputs = [args.masc, args.fem]
+    if is_up_to_date([SEEDS_FILEPATH], inputs, args):
+        return
+    import json
+    from seeding.obtain_seeds import obtain_seeds
+
+    masc_seeds, fem_seeds = obtain_seeds(args.masc, args.fem)
+
+    def write(path: Path) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"masc": sorted(masc_seeds), "fem": sorted(fem_seeds)}, f, ensure_ascii=False, indent=1)
+
+    write_artifact(SEEDS_FILEPATH, write, inputs=inputs)
+    print(f"Saved {len(masc_seeds)} masculine and {len(fem_seeds)} feminine seeds to {SEEDS_FILEPATH}")
+
+
+def index(args: argparse.Namespace) -> None:
+    """
+    Build the unannotated corpus in the token-id format, from the UD training data or from a raw-text dump, and the
+    set of all nouns.
+    """
+    inputs = [UD_DATASET_FILEPATH] + ([args.dump] if args.dump is not None else [])
+    # The dump is lowercased when ingested, the UD training data are indexed as they are
+    options = {"lowercase": args.lowercase} if args.dump is not None else dict()
+    # Found before `is_up_to_date` removes the record of the inputs of the index
+    index_reason = get_outdated_reason(INDEX_DIR, inputs, options)
+    if is_up_to_date([INDEX_DIR, NOUNS_FILEPATH], inputs, args, options):
+        return
+    import shutil
+    ud = load_ud_dataset()
+
+    if args.dump is not None:
+        from raw_corpus.ingest import ingest_dump
+        # An ingestion interrupted before recording its inputs is resumed, an index built from other inputs or with
+        # other options is ingested again
+        if args.force or index_reason not in [None, NOT_RECORDED]:
+            shutil.rmtree(INDEX_DIR, ignore_errors=True)
+        tokens = ingest_dump(args.dump, INDEX_DIR, workers=args.workers, lowercase=args.lowercase)
+    else:
+        from raw_corpus.token_corpus import write_token_corpus
+        shutil.rmtree(INDEX_DIR, ignore_errors=True)
+        write_token_corpus(ud.train.text, INDEX_DIR)
+        tokens = len(ud.train.text)
+    record_inputs(INDEX_DIR, inputs, options)
+
+    # The set of all forms of all Czech nouns (for simplification and faster computation, we use only the noun forms
     # present in our datasets)
     noun_set = ud.train.get_unique_nouns() | ud.dev.get_unique_nouns() | ud.test.get_unique_nouns()
 
+    def write(path: Path) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(f"{noun}\n" for noun in sorted(noun_set))
+
+    write_artifact(NOUNS_FILEPATH, write, inputs=inputs, options=options)
+    print(f"Indexed {tokens} tokens to {INDEX_DIR}")
     print(f"Total number of nouns in the language: {len(noun_set)}")
 
-    unannotated_corpus = ud.train.text
 
-    gender_predictor = GenderPredictor(masc_seeds=masc_seeds, fem_seeds=fem_seeds, nouns=noun_set,
-                                       unannotated_corpus=unannotated_corpus)
+def bootstrap(args: argparse.Namespace) -> None:
+    """
+    Bootstrap a predictor on the indexed corpus and save it, together with the genders predicted by it.
+    """
+    from raw_corpus.token_corpus import TokenCorpus, TOKEN_IDS_FILENAME
+
+    # The token ids change also when the corpus is extended in place
+    inputs = [SEEDS_FILEPATH, NOUNS_FILEPATH, INDEX_DIR / TOKEN_IDS_FILENAME]
+    if is_up_to_date([MODEL_FILEPATH, GENDERS_FILEPATH], inputs, args):
+        return
+    from evidence_modeling.gender_predictor import GenderPredictor
+
+    masc_seeds, fem_seeds = load_seeds()
+    nouns = load_nouns()
+    corpus = TokenCorpus(require(INDEX_DIR, "index"))
+
+    gender_predictor = GenderPredictor(masc_seeds=masc_seeds, fem_seeds=fem_seeds, nouns=nouns,
+                                       unannotated_corpus=corpus, counting_backend=args.backend,
+                                       memory_budget_mb=args.memory_budget)
+    if args.connect:
+        from bootstrapping.distributed import parse_address, remote_workers
+        with remote_workers([parse_address(address) for address in args.connect],
+                            authkey=args.authkey.encode("utf-8")) as workers:
+            gender_predictor.bootstrap_from_context(workers=workers)
+    elif args.workers:
+        from bootstrapping.distributed import local_workers
+        with local_workers(args.workers) as workers:
+            gender_predictor.bootstrap_from_context(workers=workers)
+    else:
+        gender_predictor.bootstrap_from_context()
+
+    write_artifact(MODEL_FILEPATH, gender_predictor.save, inputs=inputs)
+    write_artifact(GENDERS_FILEPATH, gender_predictor.save_genders, inputs=inputs)
+    print(f"Saved the predictor to {MODEL_FILEPATH} and its genders to {GENDERS_FILEPATH}")
+
+
+def load_genders(path: Path) -> dict[str, str]:
+    with open(require(path, "bootstrap"), "r", encoding="utf-8") as f:
+        return dict(line.rstrip("\n").split("\t") for line in f)
+
+
+def predict(args: argparse.Namespace) -> None:
+    predict_words(args.words, genders_path=args.genders)
+
+
+def predict_words(words: list[str], genders_path: Path) -> None:
+    """
+    Predict the gender of the given words (or of the words on the standard input, one per line) by the genders saved
+    with the predictor, the same as the predictions of the predictor.
+    """
+    genders = load_genders(genders_path)
+    for word in words if words else (line.strip() for line in sys.stdin):
+        print(f"{word}\t{genders.get(word, '-')}")
+
+
+def evaluate(args: argparse.Namespace) -> None:
+    """
+    Evaluate the saved predictor on the dev and test data, together with the predictions by chance, or cross-validate
+    the bootstrapping on the training data.
+    """
+    from evaluation.evaluation_harness import get_saved_predictor_tasks, get_cross_validation_tasks, \
+        run_evaluations, print_results
+
+    ud = load_ud_dataset()
+    if args.folds:
+        masc_seeds, fem_seeds = load_seeds()
+        tasks = get_cross_validation_tasks(ud.train, masc_seeds=masc_seeds, fem_seeds=fem_seeds, nouns=load_nouns(),
+                                           folds=args.folds, baselines=args.baselines)
+    else:
+        tasks = get_saved_predictor_tasks(ud, predictor_path=require(args.model, "bootstrap"), splits=args.splits,
+                                          baselines=args.baselines)
+    print_results(run_evaluations(tasks, max_workers=args.workers))
+
+
+def main() -> None:
+    # The prediction of the given words needs no options, it is run without argparse, which would take a noticeable
+    # part of its startup time
+    if sys.argv[1:2] == ["predict"] and not any(arg.startswith("-") for arg in sys.argv[2:]):
+        predict_words(sys.argv[2:], genders_path=GENDERS_FILEPATH)
+        return
+
+    import argparse
+    parser = argparse.ArgumentParser(description="Minimally supervised induction of grammatical gender. The stages "
+                                                 "are run in the order of the commands, each one reading the "
+                                                 f"artifacts of the previous ones from {ARTIFACTS_DIR}.")
+    subparsers = parser.add_subparsers(title="commands", required=True)
+
+    subparser = subparsers.add_parser("fetch", help="Download and parse the UD datasets.")
+    subparser.add_argument("--max_tokens", type=int, default=None, help="Maximum number of tokens of each dataset.")
+    subparser.set_defaults(command=fetch)
+
+    subparser = subparsers.add_parser("seeds", help="Obtain the seed nouns by translating the English ones.")
+    subparser.add_argument("--masc", type=Path, default=EN_MASC_SEEDS_FILEPATH, help="English masculine seeds.")
+    subparser.add_argument("--fem", type=Path, default=EN_FEM_SEEDS_FILEPATH, help="English feminine seeds.")
+    subparser.set_defaults(command=seeds)
+
+    subparser = subparsers.add_parser("index", help="Build the unannotated corpus and the set of nouns.")
+    subparser.add_argument("--dump", type=Path, default=None,
+                           help="Raw-text dump to use as the unannotated corpus instead of the UD training data.")
+    subparser.add_argument("--workers", type=int, default=None, help="Number of processes ingesting the dump.")
+    subparser.add_argument("--lowercase", action="store_true", help="Lowercase the dump.")
+    subparser.set_defaults(command=index)
 
-    gender_predictor.bootstrap_from_context()
+    subparser = subparsers.add_parser("bootstrap", help="Bootstrap a predictor and save it.")
+    subparser.add_argument("--backend", default=COUNTING_BACKEND, help="Counting backend of the bootstrapping.")
+    subparser.add_argument("--memory_budget", type=float, default=FREQUENCY_TABLE_MEMORY_BUDGET_MB,
+                           help="Memory budget of each frequency table in MB, the rest spills to the disk.")
+    subparser.add_argument("--workers", type=int, default=0,
+                           help="Number of local workers of the distributed bootstrapping.")
+    subparser.add_argument("--connect", nargs="+", default=[], metavar="HOST:PORT",
+                           help="Addresses of the workers of the distributed bootstrapping running on other nodes "
+                                "(see `python -m bootstrapping.distributed`), instead of local workers. The workers "
+                                "read their shards from the index, which has to be accessible to them at the same "
+                                "path.")
+    subparser.add_argument("--authkey", default=None, help="Shared secret of the remote workers.")
+    subparser.set_defaults(command=bootstrap)
 
-    dataset = ud.dev
+    subparser = subparsers.add_parser("predict", help="Predict the gender of words by the saved predictor.")
+    subparser.add_argument("words", nargs="*", help="Words to predict, read from the standard input if none.")
+    subparser.add_argument("--genders", type=Path, default=GENDERS_FILEPATH,
+                           help="The genders saved with the predictor.")
+    subparser.set_defaults(command=predict)
 
-    predictions = gender_predictor.predict_gender_for_corpus(dataset.text)
+    subparser = subparsers.add_parser("evaluate", help="Evaluate the saved predictor.")
+    subparser.add_argument("--model", type=Path, default=MODEL_FILEPATH, help="The saved predictor.")
+    subparser.add_argument("--splits", nargs="+", default=["dev", "test"], help="Splits to evaluate on.")
+    subparser.add_argument("--folds", type=int, default=0,
+                           help="Cross-validate the bootstrapping on this number of folds of the training data "
+                                "instead.")
+    subparser.add_argument("--no_baselines", dest="baselines", action="store_false",
+                           help="Do not evaluate the predictions by chance.")
+    subparser.add_argument("--workers", type=int, default=None, help="Number of evaluation processes.")
+    subparser.set_defaults(command=evaluate)
 
-    print(ud.evaluate(dataset, predictions))
+    for name in ["fetch", "seeds", "index", "bootstrap"]:
+        subparsers.choices[name].add_argument("--force", action="store_true",
+                                              help="Rebuild the artifact even if it exists.")
 
-    print()
-    print("Predictions by chance:")
-    print("Predict all fem:")
-    print(ud.evaluate(dataset, [Gender.FEMININE] * len(dataset)))
-    print("Predict all masc:")
-    print(ud.evaluate(dataset, [Gender.MASCULINE] * len(dataset)))
+    args = parser.parse_args()
+    if args.command is bootstrap and args.connect and args.authkey is None:
+        subparsers.choices["bootstrap"].error("--connect requires --authkey")
+    args.command(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+import argparse
+import bz2
+import gzip
+import json
+import lzma
+import os
+import sys
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from raw_corpus.tokenizer import tokenize_chunk
+from raw_corpus.token_corpus import VOCABULARY_FILENAME, TOKEN_IDS_FILENAME, TOKEN_ID_TYPECODE, to_little_endian
+
+PROGRESS_FILENAME = "progress.json"
+
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open, ".lzma": lzma.open}
+
+
+def open_dump(path: Path) -> BinaryIO:
+    """
+    Open a plain-text or compressed dump for binary reading, the compression is recognized by the file suffix.
+    """
+    opener = OPENERS.get(Path(path).suffix, open)
+    return opener(path, "rb")
+
+
+def read_chunks(f: BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    """
+    Read the given file in consecutive chunks of approximately `chunk_size` bytes, each ending at a line boundary, so
+    that no token is split between two chunks. A chunk is extended by at most another `chunk_size` bytes to reach the
+    end of its line. If the line is longer (or the dump has no line breaks), the chunk ends at its last whitespace
+    instead, and only a single token longer than a chunk is split.
+    """
+    carry = b""
+    while True:
+        chunk = carry + f.read(chunk_size)
+        if not chunk:
+            return
+        rest = f.readline(chunk_size)
+        chunk += rest
+        if not rest or rest.endswith(b"\n"):
+            carry = b""
+            yield chunk
+            continue
+
+        # The ASCII whitespace bytes never occur inside a multi-byte UTF-8 character
+        split = max(chunk.rfind(whitespace) for whitespace in [b" ", b"\t", b"\n", b"\r", b"\f", b"\v"])
+        if split < 0:
+            carry = b""
+            yield chunk
+        else:
+            carry = chunk[split + 1:]
+            yield chunk[:split + 1]
+
+
+def load_progress(output_dir: Path) -> Optional[dict]:
+    path = output_dir / PROGRESS_FILENAME
+    if not path.exists():
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_progress(output_dir: Path, progress: dict) -> None:
+    # Replace the file atomically, so that an interruption leaves either the old or the new progress.
+    tmp_path = output_dir / f"{PROGRESS_FILENAME}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, output_dir / PROGRESS_FILENAME)
+
+
+def load_vocabulary(output_dir: Path, vocabulary_bytes: int) -> dict[str, int]:
+    """
+    Load the vocabulary written before an interruption, dropping the tokens written after the last saved progress.
+    """
+    path = output_dir / VOCABULARY_FILENAME
+    with open(path, "r+b") as f:
+        f.truncate(vocabulary_bytes)
+        tokens = f.read().decode("utf-8").split("\n")[:-1]
+    return {token: token_id for token_id, token in enumerate(tokens)}
+
+
+def ingest_dump(input_path: Path, output_dir: Path, workers: Optional[int] = None,
+                chunk_size: int = DEFAULT_CHUNK_SIZE, lowercase: bool = False) -> int:
+    """
+    Tokenize and normalize a raw-text dump in a process pool, and write it in the interned token-id format, readable
+    by `TokenCorpus`. The progress is saved after every chunk, and the ingestion of the same dump into the same
+    directory resumes where it was interrupted. A dump changed since its ingestion started is refused.
+
+    The progress is saved as an offset in the decompressed dump. A compressed dump cannot seek, so resuming it
+    decompresses (without tokenizing) everything before the offset again, which takes time proportional to the part
+    already ingested. To resume large dumps quickly, decompress them first.
+    :param input_path: The dump, plain text or compressed by gzip, bzip2 or xz, in UTF-8.
+    :param output_dir: Directory for the token corpus, is created if necessary.
+    :param workers: Number of worker processes, defaults to the number of CPUs.
+    :param chunk_size: Approximate size of the chunks of the dump processed by the workers, in bytes.
+    :param lowercase: Whether to lowercase the text.
+    :return: Total number of tokens of the corpus.
+    """
+    output_dir = Path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count()
+    options = {"input": str(Path(input_path).resolve()), "lowercase": lowercase}
+    # The dump is identified also by its size and modification time, so that a dump modified or replaced at the same
+    # path is not resumed from the offset within the old one
+    stat = os.stat(input_path)
+    dump_version = {"input_size": stat.st_size, "input_mtime_ns": stat.st_mtime_ns}
+
+    progress = load_progress(output_dir)
+    if progress is None:
+        progress = {**options, **dump_version, "input_offset": 0, "tokens": 0, "vocabulary_bytes": 0,
+                    "finished": False}
+        for filename in [VOCABULARY_FILENAME, TOKEN_IDS_FILENAME]:
+            open(output_dir / filename, "wb").close()
+    elif any(progress[option] != value for option, value in options.items()):
+        raise RuntimeError(f"The directory {output_dir} contains the ingestion of {progress['input']} with "
+                           f"lowercase={progress['lowercase']}, cannot resume it with different input or options.")
+    elif any(progress.get(key) != value for key, value in dump_version.items()):
+        raise RuntimeError(f"The directory {output_dir} contains the ingestion of {progress['input']}, which has "
+                           f"changed since, cannot resume it. Remove the directory to ingest the dump again.")
+    if progress["finished"]:
+        return progress["tokens"]
+
+    vocabulary = load_vocabulary(output_dir, progress["vocabulary_bytes"])
+    if progress["input_offset"] > 0:
+        print(f"Resuming ingestion of {input_path} at byte {progress['input_offset']} "
+              f"({progress['tokens']} tokens done)", file=sys.stderr)
+        if Path(input_path).suffix in OPENERS:
+            print("The dump is compressed, decompressing it up to the resumed position first", file=sys.stderr)
+
+    start = time.perf_counter()
+    processed_bytes = 0
+
+    with open_dump(input_path) as dump, \
+            open(output_dir / VOCABULARY_FILENAME, "ab") as vocabulary_file, \
+            open(output_dir / TOKEN_IDS_FILENAME, "r+b") as ids_file, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        dump.seek(progress["input_offset"])
+        ids_file.truncate(progress["tokens"] * array(TOKEN_ID_TYPECODE).itemsize)
+        ids_file.seek(0, os.SEEK_END)
+
+        # Keep only a bounded number of chunks in flight, so that the dump is never read into memory as a whole. The
+        # results are written in the order of the chunks, so that the corpus keeps the order of the dump.
+        pending = deque()
+        chunks = read_chunks(dump, chunk_size)
+
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.append((len(chunk), executor.submit(tokenize_chunk, chunk, lowercase)))
+            if not pending:
+                break
+
+            chunk_length, future = pending.popleft()
+            local_vocabulary, local_ids = future.result()
+
+            # Map the ids of the chunk to the global ids, adding the new tokens to the vocabulary
+            new_tokens = []
+            global_ids = []
+            for token in local_vocabulary:
+                token_id = vocabulary.get(token)
+                if token_id is None:
+                    token_id = len(vocabulary)
+                    vocabulary[token] = token_id
+                    new_tokens.append(token)
+                global_ids.append(token_id)
+            ids = array(TOKEN_ID_TYPECODE, map(global_ids.__getitem__, local_ids))
+
+            vocabulary_file.write("".join(f"{token}\n" for token in new_tokens).encode("utf-8"))
+            ids_file.write(to_little_endian(ids))
+            vocabulary_file.flush()
+            ids_file.flush()
+            os.fsync(vocabulary_file.fileno())
+            os.fsync(ids_file.fileno())
+
+            progress["input_offset"] += chunk_length
+            progress["tokens"] += len(ids)
+            progress["vocabulary_bytes"] = vocabulary_file.tell()
+            save_progress(output_dir, progress)
+
+            processed_bytes += chunk_length
+            elapsed = time.perf_counter() - start
+            print(f"Ingested {progress['input_offset'] / 2 ** 20:.0f} MB, {progress['tokens']} tokens, "
+                  f"{len(vocabulary)} types ({processed_bytes / 2 ** 20 / elapsed * 60:.0f} MB/min)", file=sys.stderr)
+
+    progress["finished"] = True
+    save_progress(output_dir, progress)
+    return progress["tokens"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest a raw-text dump into the interned token-id format.")
+    parser.add_argument("input", type=Path, help="Plain-text or compressed (.gz, .bz2, .xz) dump in UTF-8.")
+    parser.add_argument("output_dir", type=Path, help="Directory for the token corpus.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--chunk_size", type=int, default=DEFAULT_CHUNK_SIZE, help="Size of the chunks in bytes.")
+    parser.add_argument("--lowercase", action="store_true", help="Lowercase the text.")
+    args = parser.parse_args()
+
+    tokens = ingest_dump(args.input, args.output_dir, workers=args.workers, chunk_size=args.chunk_size,
+                         lowercase=args.lowercase)
+    print(f"Total number of tokens: {tokens}")
+
+
+if __name__ == "__main__":
+    main()
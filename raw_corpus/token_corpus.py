@@ -0,0 +1,125 @@
+import mmap
+import os
+import sys
+from array import array
+from pathlib import Path
+from typing import Iterable, Sequence, overload
+
+# A token corpus is a directory with the vocabulary (one token per line, the line number being the id of the token)
+# and the token ids of the whole corpus (unsigned 32-bit little-endian integers).
+VOCABULARY_FILENAME = "vocabulary.txt"
+TOKEN_IDS_FILENAME = "tokens.bin"
+
+TOKEN_ID_TYPECODE = "I"
+
+
+def to_little_endian(ids: array) -> bytes:
+    """
+    Convert an array of token ids to the bytes stored in the token ids file.
+    """
+    if sys.byteorder == "big":
+        ids = array(TOKEN_ID_TYPECODE, ids)
+        ids.byteswap()
+    return ids.tobytes()
+
+
+class TokenCorpus(Sequence[str]):
+    """
+    Corpus stored in the interned token-id format. The token ids are memory-mapped, so the corpus does not have to fit
+    into memory, and the corpus can be used directly wherever a sequence of tokens is expected. The corpus can be
+    extended by appending tokens, which are written to its directory.
+    """
+    directory: Path
+    vocabulary: list[str]
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+        with open(self.directory / VOCABULARY_FILENAME, "r", encoding="utf-8", newline="") as f:
+            # Not `splitlines`, which splits also on other line boundaries than the newline.
+            self.vocabulary = f.read().split("\n")[:-1]
+        # Ids of the tokens of the vocabulary, created when the corpus is extended for the first time
+        self._token_ids = None
+        self._map_ids()
+
+    def _map_ids(self) -> None:
+        ids_path = self.directory / TOKEN_IDS_FILENAME
+        if os.path.getsize(ids_path) == 0:
+            self._mmap = None
+            self.ids = memoryview(array(TOKEN_ID_TYPECODE))
+        else:
+            with open(ids_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if sys.byteorder == "big":
+                ids = array(TOKEN_ID_TYPECODE)
+                ids.frombytes(self._mmap)
+                ids.byteswap()
+                self.ids = memoryview(ids)
+            else:
+                self.ids = memoryview(self._mmap).cast(TOKEN_ID_TYPECODE)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @overload
+    def __getitem__(self, index: int) -> str:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[str]:
+        ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.vocabulary[token_id] for token_id in self.ids[index]]
+        return self.vocabulary[self.ids[index]]
+
+    def __iter__(self):
+        vocabulary = self.vocabulary
+        for token_id in self.ids:
+            yield vocabulary[token_id]
+
+    def extend(self, tokens: Iterable[str]) -> None:
+        """
+        Append the given tokens to the corpus, writing them to its directory. The tokens missing in the vocabulary are
+        appended to it, so that the ids of the existing tokens do not change. Takes time proportional to the number of
+        the appended tokens, besides indexing the vocabulary on the first extension.
+        """
+        if self._token_ids is None:
+            self._token_ids = {token: token_id for token_id, token in enumerate(self.vocabulary)}
+        ids = array(TOKEN_ID_TYPECODE)
+        new_tokens = []
+        for token in tokens:
+            token_id = self._token_ids.get(token)
+            if token_id is None:
+                token_id = self._token_ids[token] = len(self._token_ids)
+                new_tokens.append(token)
+            ids.append(token_id)
+
+        with open(self.directory / VOCABULARY_FILENAME, "a", encoding="utf-8", newline="") as f:
+            f.writelines(f"{token}\n" for token in new_tokens)
+        with open(self.directory / TOKEN_IDS_FILENAME, "ab") as f:
+            f.write(to_little_endian(ids))
+        # The vocabulary is extended in place, as it may be shared, e.g. by a counting backend
+        self.vocabulary.extend(new_tokens)
+        self._map_ids()
+
+    def __reduce__(self):
+        # Reopen the memory-mapped files instead of pickling their content, e.g. when sent to a worker process.
+        return TokenCorpus, (self.directory,)
+
+
+def write_token_corpus(tokens: Iterable[str], directory: Path) -> None:
+    """
+    Intern the given tokens and write them in the token-id format, e.g. to use the text of an annotated dataset in the
+    same way as an ingested raw dump.
+    :param tokens: The tokens of the corpus.
+    :param directory: Directory to write the corpus to, is created if necessary.
+    """
+    os.makedirs(directory, exist_ok=True)
+    vocabulary = dict()
+    ids = array(TOKEN_ID_TYPECODE, [vocabulary.setdefault(token, len(vocabulary)) for token in tokens])
+
+    with open(Path(directory) / VOCABULARY_FILENAME, "w", encoding="utf-8", newline="") as f:
+        f.writelines(f"{token}\n" for token in vocabulary)
+    with open(Path(directory) / TOKEN_IDS_FILENAME, "wb") as f:
+        f.write(to_little_endian(ids))
@@ -0,0 +1,44 @@
+import re
+import unicodedata
+from array import array
+
+# Words are maximal runs of letters and digits; every other non-space character is a token of its own, which matches
+# the tokenization of punctuation in the UD treebanks.
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def normalize(text: str, lowercase: bool = False) -> str:
+    """
+    Normalize raw text before tokenization.
+    :param text: The raw text.
+    :param lowercase: Whether to lowercase the text. The UD forms keep the original case, so the default is not to.
+    :return: The normalized text.
+    """
+    text = unicodedata.normalize("NFC", text)
+    if lowercase:
+        text = text.lower()
+    return text
+
+
+def tokenize(text: str, lowercase: bool = False) -> list[str]:
+    """
+    Normalize and tokenize raw text.
+    :param text: The raw text.
+    :param lowercase: Whether to lowercase the text.
+    :return: List of tokens.
+    """
+    return TOKEN_PATTERN.findall(normalize(text, lowercase=lowercase))
+
+
+def tokenize_chunk(data: bytes, lowercase: bool = False) -> tuple[list[str], array]:
+    """
+    Tokenize a chunk of a raw UTF-8 dump and intern its tokens locally, so that only the distinct tokens of the chunk
+    (and not all of its tokens) are sent back from a worker process.
+    :param data: The chunk, ending at a line boundary.
+    :param lowercase: Whether to lowercase the text.
+    :return: The list of distinct tokens of the chunk, and the chunk as ids into that list.
+    """
+    local_vocabulary = dict()
+    tokens = tokenize(data.decode("utf-8", errors="replace"), lowercase=lowercase)
+    local_ids = array("I", [local_vocabulary.setdefault(token, len(local_vocabulary)) for token in tokens])
+    return list(local_vocabulary), local_ids
@@ -0,0 +1,223 @@
+import json
+import os
+import sqlite3
+import tempfile
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Hashable, Iterable, Iterator, Optional
+
+from bootstrapping.contexts import ContextType, Context
+from config import SPILL_DIR
+from evidence_modeling.frequency import Frequency
+
+# Rough memory taken by one in-memory entry of a context table: the key with its strings, the frequency and the slot
+# of the ordered dictionary.
+ENTRY_SIZE_ESTIMATE = 600
+
+# Number of entries written to or read from the disk at once.
+BATCH_SIZE = 10000
+
+# Number of keys looked up by one query when prefetching, below the limit of query parameters of older SQLite versions.
+PREFETCH_BATCH_SIZE = 500
+
+
+def encode_key(key: Hashable) -> str:
+    """
+    Encode a key of a frequency table (a noun or a context) as a string stored on the disk.
+    """
+    if isinstance(key, str):
+        return "s" + key
+    if isinstance(key, Context):
+        return "c" + json.dumps([key.context_type.name, key.left, key.right], ensure_ascii=False)
+    raise TypeError(f"Cannot store key of type {type(key).__name__} in a frequency table")
+
+
+def decode_key(encoded: str) -> Hashable:
+    if encoded[0] == "s":
+        return encoded[1:]
+    context_type, left, right = json.loads(encoded[1:])
+    return Context(context_type=ContextType[context_type], left=left, right=right)
+
+
+class SpillingFrequencyTable(MutableMapping):
+    """
+    Table of frequencies of nouns or contexts, keeping at most as many entries in memory as fit into the given memory
+    budget. The least recently used entries spill to an SQLite database on the disk, in batches, and are loaded back
+    when accessed again. The table can replace the frequency dictionaries when they do not fit into memory.
+
+    As with a dictionary, a frequency returned by the table can be modified in place, but only until the next access to
+    the table, which may spill it to the disk.
+    """
+
+    def __init__(self, memory_budget_mb: float, directory: Optional[Path] = None) -> None:
+        """
+        :param memory_budget_mb: Memory budget of the entries kept in memory, in MB.
+        :param directory: Directory for the database file, the default temporary directory by default. The file is
+        deleted when the table is closed or garbage collected.
+        """
+        self.max_entries_in_memory = max(2, int(memory_budget_mb * 2 ** 20 / ENTRY_SIZE_ESTIMATE))
+        self._spill_batch_size = min(BATCH_SIZE, self.max_entries_in_memory // 2)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._spilled = False
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        handle, self.path = tempfile.mkstemp(prefix="frequencies-", suffix=".sqlite", dir=directory)
+        os.close(handle)
+        self._db = sqlite3.connect(self.path)
+        # The database holds only the spilled part of the table, it need not survive a crash
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("CREATE TABLE frequencies (key TEXT PRIMARY KEY, quest INTEGER, masc INTEGER, fem INTEGER) "
+                         "WITHOUT ROWID")
+        self._finalizer = weakref.finalize(self, SpillingFrequencyTable._remove_database, self._db, self.path)
+
+    @staticmethod
+    def _remove_database(db: sqlite3.Connection, path: str) -> None:
+        db.close()
+        os.remove(path)
+
+    def close(self) -> None:
+        self._finalizer()
+
+    def _load(self, key: Hashable) -> Optional[Frequency]:
+        row = self._db.execute("SELECT quest, masc, fem FROM frequencies WHERE key = ?", (encode_key(key),)).fetchone()
+        if row is None:
+            return None
+        return Frequency(quest=row[0], masc=row[1], fem=row[2])
+
+    def _spill(self) -> None:
+        """
+        Write the least recently used entries to the disk, until there is room for a batch of new entries in memory.
+        """
+        if not self._spilled:
+            print(f"Frequency table exceeds its memory budget ({self.max_entries_in_memory} entries), spilling to "
+                  f"{self.path}")
+            self._spilled = True
+
+        count = len(self._entries) - self.max_entries_in_memory + self._spill_batch_size
+        rows = []
+        for _ in range(count):
+            key, frequency = self._entries.popitem(last=False)
+            rows.append((encode_key(key), frequency.quest, frequency.masc, frequency.fem))
+        self._db.executemany("INSERT OR REPLACE INTO frequencies VALUES (?, ?, ?, ?)", rows)
+        self._db.commit()
+
+    def _put_in_memory(self, key: Hashable, frequency: Frequency) -> None:
+        self._entries[key] = frequency
+        if len(self._entries) > self.max_entries_in_memory:
+            self._spill()
+
+    def prefetch(self, keys: Iterable[Hashable]) -> None:
+        """
+        Load the given keys from the disk in batches, so that accessing them does not read them from the disk one by
+        one. At most half of the entries fitting into the memory budget are loaded.
+        """
+        if not self._spilled:
+            return
+        missing = [key for key in keys if key not in self._entries][:self.max_entries_in_memory // 2]
+        for batch_start in range(0, len(missing), PREFETCH_BATCH_SIZE):
+            encoded = [encode_key(key) for key in missing[batch_start:batch_start + PREFETCH_BATCH_SIZE]]
+            rows = self._db.execute(f"SELECT key, quest, masc, fem FROM frequencies WHERE key IN "
+                                    f"({', '.join('?' * len(encoded))})", encoded).fetchall()
+            for encoded_key, quest, masc, fem in rows:
+                self._put_in_memory(decode_key(encoded_key), Frequency(quest=quest, masc=masc, fem=fem))
+
+    def flush(self) -> None:
+        """
+        Write all the entries in memory to the disk, keeping them also in memory.
+        """
+        rows = [(encode_key(key), frequency.quest, frequency.masc, frequency.fem)
+                for key, frequency in self._entries.items()]
+        self._db.executemany("INSERT OR REPLACE INTO frequencies VALUES (?, ?, ?, ?)", rows)
+        self._db.commit()
+
+    def __getitem__(self, key: Hashable) -> Frequency:
+        frequency = self._entries.get(key)
+        if frequency is not None:
+            self._entries.move_to_end(key)
+            return frequency
+        if self._spilled:
+            frequency = self._load(key)
+            if frequency is not None:
+                self._put_in_memory(key, frequency)
+                return frequency
+        raise KeyError(key)
+
+    def __setitem__(self, key: Hashable, frequency: Frequency) -> None:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        elif not self._spilled or self._load(key) is None:
+            self._size += 1
+        self._put_in_memory(key, frequency)
+
+    def __delitem__(self, key: Hashable) -> None:
+        in_memory = self._entries.pop(key, None) is not None
+        on_disk = False
+        if self._spilled:
+            on_disk = self._db.execute("DELETE FROM frequencies WHERE key = ?", (encode_key(key),)).rowcount > 0
+        if not in_memory and not on_disk:
+            raise KeyError(key)
+        self._size -= 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        if key in self._entries:
+            return True
+        return self._spilled and self._load(key) is not None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _iterate_over_rows(self) -> Iterator[tuple[str, int, int, int]]:
+        # All the entries are on the disk after flushing. The rows are read in batches ordered by the key, each batch
+        # by a new query, so that the table can be accessed (and spill) between the batches.
+        self.flush()
+        last_key = ""
+        while rows := self._db.execute("SELECT key, quest, masc, fem FROM frequencies WHERE key > ? ORDER BY key "
+                                       "LIMIT ?", (last_key, BATCH_SIZE)).fetchall():
+            yield from rows
+            last_key = rows[-1][0]
+
+    def __iter__(self) -> Iterator[Hashable]:
+        if not self._spilled:
+            yield from list(self._entries)
+            return
+        for encoded_key, _, _, _ in self._iterate_over_rows():
+            yield decode_key(encoded_key)
+
+    def items(self) -> Iterator[tuple[Hashable, Frequency]]:
+        """
+        Iterate over the entries, reading the spilled ones from the disk in batches. Each yielded frequency is in the
+        table, so it can be modified in place as the one returned by `table[key]`.
+        """
+        if not self._spilled:
+            yield from list(self._entries.items())
+            return
+        for encoded_key, quest, masc, fem in self._iterate_over_rows():
+            key = decode_key(encoded_key)
+            frequency = self._entries.get(key)
+            if frequency is None:
+                frequency = Frequency(quest=quest, masc=masc, fem=fem)
+                self._put_in_memory(key, frequency)
+            yield key, frequency
+
+
+def create_frequency_table(memory_budget_mb: Optional[float]) -> MutableMapping:
+    """
+    Create an empty table of frequencies: a dictionary, or a table spilling to the disk if a memory budget is given.
+    :param memory_budget_mb: Memory budget of the table in MB, None for no budget.
+    """
+    if memory_budget_mb is None:
+        return dict()
+    return SpillingFrequencyTable(memory_budget_mb=memory_budget_mb, directory=SPILL_DIR)
+
+
+def prefetch(table: MutableMapping, keys: Iterable[Hashable]) -> None:
+    """
+    Prefetch the given keys of the table in batches, if it is a table spilling to the disk.
+    """
+    if isinstance(table, SpillingFrequencyTable):
+        table.prefetch(keys)
@@ -2,10 +2,10 @@ from typing import TextIO, Sequence
 import os
 import sys
 import urllib.request
+import copy
 from collections import Counter
 
 from config import DATA_DIR
-import conllu
 
 from gender import Gender
 from typing import Optional
@@ -23,6 +23,9 @@ class UDDataset:
 
     class Dataset:
         def __init__(self, data_file: TextIO, max_tokens: int | None = None) -> None:
+            # Imported only for parsing, the parsed (e.g. unpickled) datasets do not need it
+            import conllu
+
             # Load the data
             self._size = 0
             self.forms = []
@@ -79,6 +82,24 @@ class UDDataset:
             noun_set = set(relevant_nouns)
             return noun_set
 
+        def get_fold(self, fold: int, folds: int) -> tuple[list[str], "UDDataset.Dataset"]:
+            """
+            Split the dataset into `folds` contiguous parts, for cross-validation.
+            :param fold: Index of the held-out part.
+            :param folds: Total number of parts.
+            :return: The text of the dataset without the held-out part, and the held-out part as a dataset.
+            """
+            start = self._size * fold // folds
+            end = self._size * (fold + 1) // folds
+
+            held_out = copy.copy(self)
+            held_out.forms = self.forms[start:end]
+            held_out.poss = self.poss[start:end]
+            held_out.genders = self.genders[start:end]
+            held_out._size = end - start
+
+            return self.forms[:start] + self.forms[end:], held_out
+
     def __init__(self, max_tokens=None) -> None:
         for dataset_name, dataset in zip(["train-lt", "dev", "test"], ["train", "dev", "test"]):
             # for dataset_name, dataset in zip(["train-ca", "dev", "test"], ["train", "dev", "test"]):
@@ -126,6 +147,8 @@ class UDDataset:
                 if prediction == gold_gender:
                     correct += 1
 
-        precision = correct / predicted_sth
-        recall = predicted_sth / total
+        # A predictor predicting nothing (e.g. on a small held-out fold) has undefined precision, it is reported as NaN
+        # rather than failing the whole evaluation
+        precision = correct / predicted_sth if predicted_sth else float("nan")
+        recall = predicted_sth / total if total else float("nan")
         return EvaluationMetric(precision=precision, recall=recall)